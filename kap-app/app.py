@@ -1,6 +1,7 @@
-import streamlit as st
 import pandas as pd
-import re
+import streamlit as st
+from kapmotor import (file_digest, read_package_totals, read_inventory, stock_classes, pack_pieces, pack_stock, aggregate_planks, plank_table, plank_rows, iter_plank_text, PLANK_HEADER,
+                      page_count, page, iter_csv, to_bytes, write_xlsx)
 
 # Sätt sidans titel och layout
 st.set_page_config(page_title="Kapmaskinen", layout="wide")
@@ -9,84 +10,148 @@ st.title("🛠️ KAPMASKIN v1.0")
 # --- INSTÄLLNINGAR I SIDOPANELEN ---
 with st.sidebar:
     st.header("Inställningar")
-    raw_len = st.number_input("Råmaterialets längd (mm)", value=6000)
+    ravara = st.radio("Råvara", ["En längd (obegränsat)", "Lager med flera längder"])
+    lager_mode = ravara.startswith("Lager")
+    raw_len = st.number_input("Råmaterialets längd (mm)", value=6000, disabled=lager_mode)
     kerf = st.number_input("Sågbladets bredd (mm)", value=4)
     target_waste = st.slider("Önskat max-spill per planka (%)", 0, 100, 10)
+    strategi = st.radio("Packningsstrategi", ["First Fit Decreasing", "Best Fit Decreasing"])
+
+def read_packing_list(file, progress=None):
+    # Summerar antal per paket och längd (mm) block för block, utan att hålla hela arket i minnet.
+    # Senast lästa fil sparas i sessionen (inte st.cache_data, som inte kan spela upp
+    # förloppsindikatorn utanför funktionen), så omkörningar läser inte om filen.
+    key = file_digest(file)
+    if st.session_state.get('packlista_key') != key:
+        st.session_state.packlista = read_package_totals(file, progress); st.session_state.packlista_key = key
+    return st.session_state.packlista
+
+def read_stock_file(file):
+    # Lagret ({längd: antal}) ur en packlista i samma format som v81 läser, sparat i sessionen som ovan
+    key = file_digest(file)
+    if st.session_state.get('lagerfil_key') != key:
+        classes = stock_classes(read_inventory(file))
+        st.session_state.lager_app = pd.DataFrame({"Längd (mm)": list(classes), "Antal": list(classes.values())})
+        st.session_state.lagerfil_key = key
+
+# --- LAGRET (FLERA LÄNGDER) ---
+stock = None
+if lager_mode:
+    with st.sidebar:
+        st.subheader("Lager")
+        st.caption("Varje ny planka tas av den kortaste längden i lager som rymmer biten.")
+        if 'lager_app' not in st.session_state:
+            st.session_state.lager_app = pd.DataFrame({"Längd (mm)": [6000, 5400, 4200], "Antal": [50, 50, 50]})
+        lager_fil = st.file_uploader("Hämta lagret ur en packlista (valfritt)", type=["xlsx", "csv"], key="lagerfil")
+        if lager_fil:
+            read_stock_file(lager_fil)
+        lager = st.data_editor(st.session_state.lager_app, num_rows="dynamic", hide_index=True, use_container_width=True)
+        # Samma längd på flera rader räknas ihop; tomma rader och antal 0 hoppas över
+        stock = {}
+        for l, n in lager[["Längd (mm)", "Antal"]].dropna().itertuples(index=False, name=None):
+            if int(l) > 0 and int(n) > 0: stock[int(l)] = stock.get(int(l), 0) + int(n)
+
+def schema_exports(schema, target_waste):
+    # Kapschemat som CSV/Excel/TXT, byggt en gång per schema och max-spill och sparat i schemat.
+    # download_button tar bara färdiga bytes i de Streamlit-versioner som går på Python 3.9
+    if schema.get('export_waste') != target_waste:
+        grupper = schema['grupper']
+        schema['export'] = {'csv': to_bytes(iter_csv(PLANK_HEADER, plank_rows(grupper, target_waste)), bom=True),
+                            'xlsx': write_xlsx(PLANK_HEADER, plank_rows(grupper, target_waste)),
+                            'txt': to_bytes(iter_plank_text(grupper, target_waste))}
+        schema['export_waste'] = target_waste
+    return schema['export']
 
 # --- FILUPPLADDNING ---
 file = st.file_uploader("Ladda upp din Excel-fil", type=["xlsx", "csv"])
 
 if file:
-    # Läs in filen (stöder både Excel och CSV)
-    df = pd.read_excel(file) if file.name.endswith('.xlsx') else pd.read_csv(file)
+    # Läs in filen (stöder både Excel och CSV) i block med förloppsindikator
+    bar = st.progress(0.0, text="Läser in filen...")
+    per_paket = read_packing_list(file, progress=lambda f: bar.progress(f, text=f"Läser in filen... {f:.0%}"))
+    bar.empty()
     
     st.write("### 1. Välj paket att optimera")
     
-    # Letar efter en kolumn för urval. Vi använder första kolumnen om 'Paket' inte hittas.
-    col_name = 'Paket' if 'Paket' in df.columns else df.columns[0]
-    
-    paket_lista = df[col_name].astype(str).unique().tolist()
+    paket_lista = list(per_paket)
     valda_paket = st.multiselect("Välj paket ur listan:", options=paket_lista)
     
     if valda_paket:
-        # Filtrera fram de valda paketen
-        valda_df = df[df[col_name].astype(str).isin(valda_paket)]
-        
-        # Identifiera längder (t.ex. 3.6, 4.2) och räkna antal bitar
-        behov = []
-        for col in df.columns:
-            col_clean = str(col).replace(',', '.')
-            # Letar efter siffror/decimaler i kolumnnamnet
-            match = re.findall(r'\d+\.\d+|\d+', col_clean)
-            
-            if match:
-                val = float(match[0])
-                # Omvandla meter till mm (t.ex. 4.2 -> 4200)
-                mm_val = int(val * 1000) if val < 100 else int(val)
-                
-                # Räkna ihop totalt antal bitar i de valda raderna
-                antal = int(pd.to_numeric(valda_df[col], errors='coerce').sum() or 0)
-                for _ in range(antal):
-                    behov.append(mm_val)
+        # Räkna ihop totalt antal bitar per längd i de valda paketen
+        summor = {}
+        for p in valda_paket:
+            for mm_val, antal in per_paket[p].items():
+                summor[mm_val] = summor.get(mm_val, 0) + antal
+        behov = {mm_val: int(antal or 0) for mm_val, antal in summor.items() if int(antal or 0) > 0}
+        antal_bitar = sum(behov.values())
 
         if behov:
-            st.success(f"✅ {len(behov)} bitar redo för optimering.")
+            st.success(f"✅ {antal_bitar} bitar redo för optimering.")
             
-            if st.button("BERÄKNA KAPSCHEMA"):
-                # Algoritm: First Fit Decreasing
-                behov.sort(reverse=True)
-                plankor = []
-                
-                for bit in behov:
-                    passade = False
-                    for p in plankor:
-                        if sum(p) + (len(p) * kerf) + bit <= raw_len:
-                            p.append(bit)
-                            passade = True
-                            break
-                    if not passade:
-                        plankor.append([bit])
-                
+            inputs = (tuple(sorted(behov.items())), tuple(sorted(stock.items())) if lager_mode else raw_len, kerf, strategi)
+            if lager_mode and not stock:
+                st.warning("Lagret är tomt. Lägg till längder i sidopanelen.")
+            elif st.button("BERÄKNA KAPSCHEMA"):
+                # Algoritm: First/Best Fit Decreasing på antal per längd, i lagret: kortaste längd som räcker
+                if lager_mode:
+                    packning = pack_stock(behov, stock, kerf, best_fit="Best" in strategi)
+                else:
+                    plankor = pack_pieces(behov, raw_len, kerf, best_fit="Best" in strategi)
+                    packning = {'plankor': plankor, 'langder': raw_len, 'forbrukat': {raw_len: len(plankor)}, 'kvar': None, 'ej_packat': {}}
+                plankor = packning['plankor']
+                # Resultatet sparas så att bläddring och export inte kräver en ny beräkning
+                st.session_state.kapschema = {
+                    'inputs': inputs, 'antal': len(plankor), 'grupper': aggregate_planks(plankor, packning['langder']),
+                    'snitt': sum(len(p)-1 for p in plankor) * kerf,
+                    'forbrukat': packning['forbrukat'], 'kvar': packning['kvar'], 'ej_packat': packning['ej_packat'],
+                }
+
+            schema = st.session_state.get('kapschema')
+            if schema and schema['inputs'] == inputs:
+                grupper = schema['grupper']
                 # --- RESULTAT ---
                 st.divider()
                 c1, c2, c3 = st.columns(3)
-                c1.metric("Antal 6m-längder", f"{len(plankor)} st")
+                c1.metric("Plankor ur lagret" if lager_mode else "Antal 6m-längder", f"{schema['antal']} st")
                 
-                anvand_mm = sum(behov)
-                total_mm = len(plankor) * raw_len
-                snitt_forlust = sum(len(p)-1 for p in plankor) * kerf
+                ej_packat = schema['ej_packat']
+                anvand_mm = sum(mm_val * antal for mm_val, antal in behov.items()) - sum(mm_val * antal for mm_val, antal in ej_packat.items())
+                total_mm = sum(rl * antal for rl, bitar, antal, p_spill in grupper)
+                snitt_forlust = schema['snitt']
                 # Verkligt spill beräknat på totalt material minus använd trä och sågsnitt
-                spill_pct = (1 - (anvand_mm / (total_mm - snitt_forlust))) * 100
+                spill_pct = (1 - (anvand_mm / (total_mm - snitt_forlust))) * 100 if total_mm > snitt_forlust else 0
                 c2.metric("Total spillprocent", f"{spill_pct:.1f} %")
-                c3.metric("Bitar totalt", len(behov))
+                c3.metric("Bitar totalt", antal_bitar)
+
+                if ej_packat:
+                    st.error(f"Lagret räcker inte: {sum(ej_packat.values())} bitar fick inte plats.")
+                    st.dataframe(pd.DataFrame(sorted(ej_packat.items(), reverse=True), columns=["Längd (mm)", "Ej packade (st)"]), hide_index=True)
+                if schema['kvar'] is not None:
+                    st.write("### Förbrukat lager")
+                    st.dataframe(pd.DataFrame([(l, schema['forbrukat'].get(l, 0) + kvar, schema['forbrukat'].get(l, 0), kvar)
+                                               for l, kvar in sorted(schema['kvar'].items(), reverse=True)],
+                                              columns=["Längd (mm)", "I lager", "Förbrukat", "Kvar"]), hide_index=True)
 
                 st.write("### Kapningsplan")
-                for i, p in enumerate(plankor):
-                    p_spill = (1 - (sum(p) / raw_len)) * 100
+                # Identiska plankor är en rad; tabellen ritas virtuellt och detaljerna visas sida för sida
+                st.caption(f"{schema['antal']} plankor i {len(grupper)} unika mönster")
+                st.dataframe(plank_table(grupper, target_waste), hide_index=True, use_container_width=True)
+                n_sidor = page_count(len(grupper))
+                sida = st.number_input(f"Sida (av {n_sidor})", 1, n_sidor, 1) if n_sidor > 1 else 1
+                for rl, bitar, antal, p_spill in page(grupper, sida):
                     ikon = "✅" if p_spill <= target_waste else "⚠️"
-                    with st.expander(f"{ikon} Planka {i+1} (Spill: {p_spill:.1f}%)"):
-                        st.write(f"Kapa dessa längder: **{' + '.join(map(str, p))} mm**")
-                        st.progress(min(sum(p)/raw_len, 1.0))
+                    with st.expander(f"{ikon} {antal} st plankor á {rl} mm (Spill: {p_spill:.1f}%)"):
+                        st.write(f"Kapa dessa längder: **{' + '.join(map(str, bitar))} mm**")
+                        st.progress(min(sum(bitar)/rl, 1.0))
+
+                # Exporterna skrivs rad för rad, en gång per kapschema
+                e1, e2, e3 = st.columns(3)
+                exports = schema_exports(schema, target_waste)
+                e1.download_button("📥 CSV", exports['csv'], "kapschema.csv", "text/csv", use_container_width=True)
+                e2.download_button("📥 Excel", exports['xlsx'], "kapschema.xlsx",
+                                   "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+                e3.download_button("📥 TXT", exports['txt'], "kapschema.txt",
+                                   "text/plain", use_container_width=True)
         else:
             st.warning("Inga bitar hittades i de valda paketen.")
     else:
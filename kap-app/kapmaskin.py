@@ -1,66 +1,133 @@
 import streamlit as st
-import pandas as pd
-from collections import Counter
 from datetime import datetime
+import time
+import numpy as np
+import pandas as pd
+from kapmotor import (STRATEGIER, file_digest, read_inventory, plan_inventory, replan_inventory, can_replan, plan_parallel, default_workers, cache_info,
+                      clear_cache, submit, job_status, cancel_job, forget, server_load, format_seconds, summarize, format_line,
+                      empty_inventory, make_inventory, merge_inventory, take, inventory_size, total_boards, inventory_signature,
+                      performance_report, report_json, profiled, iter_export_text, pattern_table, pattern_rows, PATTERN_HEADER,
+                      page_count, page, iter_csv, to_bytes, write_xlsx)
 
 st.set_page_config(page_title="Kapmaskinen Pro v81.0", layout="wide")
 
 # --- SMART CACHING ---
-@st.cache_data
-def process_excel(file):
+# Senast inlästa fil sparas i sessionen (inte st.cache_data, som inte kan spela upp
+# förloppsindikatorn utanför funktionen vid en cacheträff)
+def process_excel(file, progress=None):
     try:
-        df = pd.read_csv(file) if file.name.endswith('.csv') else pd.read_excel(file)
-        raw_rows = []
-        for col_idx in range(3, 19): 
-            header_val = df.columns[col_idx]
-            try:
-                raw_l = float(header_val)
-                l_mm = int(round(raw_l * 1000)) if raw_l < 100 else int(round(raw_l))
-                for row_idx in range(len(df)):
-                    qty = pd.to_numeric(df.iloc[row_idx, col_idx], errors='coerce')
-                    if not pd.isna(qty) and qty > 0:
-                        raw_rows.append({
-                            'id': f"row_{row_idx}_col_{col_idx}_{datetime.now().timestamp()}",
-                            'l': l_mm, 'q': int(qty),
-                            'name': f"Paket {df.iloc[row_idx, 1] if len(df.columns)>1 else row_idx}"
-                        })
-            except: continue
-        return raw_rows
+        key = file_digest(file)
+        if st.session_state.get('excel_key') != key:
+            st.session_state.excel = read_inventory(file, progress); st.session_state.excel_key = key
+        return st.session_state.excel
     except: return None
 
+def run_optimization(inv, target_lengths, mode, workers, use_extra, extra_l, kerf, trim, max_nodes, time_limit, use_cache, compare,
+                     progress=None, cancel=None):
+    # Körs som bakgrundsjobb; med compare körs också den seriella vägen för att mäta uppsnabbningen
+    plan = plan_parallel(inv, target_lengths, mode, workers, use_extra, extra_l, kerf, trim, max_nodes, time_limit, use_cache,
+                         progress, cancel)
+    if compare and not plan.get('cancelled'):
+        start = time.perf_counter()
+        serial = plan_inventory(inv, target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit, use_cache=False, cancel=cancel)
+        plan['serial'] = {'sekunder': time.perf_counter() - start, 'spill_pct': serial['spill_pct']}
+    return plan
+
+def plan_exports(plan):
+    # Kaplistan som TXT/CSV/Excel, byggd en gång per plan och sparad i sessionen.
+    # download_button tar bara färdiga bytes i de Streamlit-versioner som går på Python 3.9
+    exports = st.session_state.get('exports')
+    if exports is None or exports['plan'] is not plan:
+        exports = {'plan': plan, 'txt': to_bytes(iter_export_text(plan)),
+                   'csv': to_bytes(iter_csv(PATTERN_HEADER, pattern_rows(plan)), bom=True),
+                   'xlsx': write_xlsx(PATTERN_HEADER, pattern_rows(plan))}
+        st.session_state.exports = exports
+    return exports
+
+@st.fragment(run_every=1.0)
+def show_job():
+    # Jobbets förlopp uppdateras varje sekund utan att resten av sidan körs om
+    job = job_status(st.session_state.job_id)
+    if job is None or job['status'] in ("klar", "avbruten", "fel"):
+        if job and job['plan']: st.session_state.plan = job['plan']
+        st.session_state.last_job = job
+        forget(st.session_state.job_id); st.session_state.job_id = None
+        st.rerun()
+    if job['status'] == "i kö":
+        running, queued = server_load()
+        st.info(f"⏳ I kö som nummer {job['ko']} ({running} jobb kör just nu på servern)")
+    else:
+        frac = job['done'] / job['total'] if job['total'] else 0.0
+        st.progress(frac, text=f"Planerar... {job['done']} av {job['total']} brädor ({frac:.0%})")
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Brädor klara", f"{job['done']} / {job['total']}")
+        c2.metric("Spill hittills", "–" if job['spill_pct'] is None else f"{job['spill_pct']:.2f} %")
+        c3.metric("Tid kvar (uppskattad)", format_seconds(job['eta_s']))
+        if job['plan']:
+            with st.expander("Bästa planen hittills"):
+                for (rl, bits, w), qty in list(summarize(job['plan']).items())[:20]:
+                    st.write(format_line(rl, bits, w, qty))
+    if st.button("⏹️ Avbryt optimeringen", key="cancel_job"):
+        cancel_job(st.session_state.job_id)
+
 # --- INITIALISERA SESSION STATE ---
-if "inventory_rows" not in st.session_state:
-    st.session_state.inventory_rows = [] 
+if "inventory" not in st.session_state:
+    st.session_state.inventory = empty_inventory()
 if "target_lengths" not in st.session_state:
     st.session_state.target_lengths = {1060: 0, 1090: 0, 1120: 0}
+if "plan" not in st.session_state:
+    st.session_state.plan = None; st.session_state.plan_inputs = None
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None; st.session_state.last_job = None
+if "import_s" not in st.session_state:
+    st.session_state.import_s = None
 
 # --- SIDOPANEL: LAGER ---
 with st.sidebar:
     st.title("📦 Lagerhantering")
     uploaded_file = st.file_uploader("Ladda upp Excel/CSV", type=["xlsx", "csv"])
     if uploaded_file and st.button("📥 Importera till lager"):
-        new_data = process_excel(uploaded_file)
-        if new_data:
-            st.session_state.inventory_rows.extend(new_data)
+        bar = st.progress(0.0, text="Läser in lager...")
+        start = time.perf_counter()
+        new_data = process_excel(uploaded_file, progress=lambda f: bar.progress(f, text=f"Läser in lager... {f:.0%}"))
+        st.session_state.import_s = time.perf_counter() - start
+        bar.empty()
+        if new_data is not None and inventory_size(new_data):
+            # Samma fil ger samma paketnycklar, så en ny import lägger inte till dubbletter
+            st.session_state.inventory = merge_inventory(st.session_state.inventory, new_data)
     
     st.divider()
     st.subheader("➕ Manuellt lager")
     m_l = st.number_input("Längd (mm)", value=5400, step=100)
     m_q = st.number_input("Antal (st)", value=100)
     if st.button("Lägg till brädor"):
-        st.session_state.inventory_rows.append({'id': str(datetime.now().timestamp()), 'l': m_l, 'q': m_q, 'name': "Manuellt"})
+        st.session_state.inventory = merge_inventory(st.session_state.inventory,
+                                                     make_inventory([m_l], [m_q], [0], [str(datetime.now().timestamp())], ["Manuellt"]))
         st.rerun()
 
+    st.divider()
+    st.subheader("🗄️ Mönstercache")
+    info = cache_info()
+    if info['active']: st.caption(f"{info['rows']} av max {info['max_rows']} mönster sparade · {info['hits']} träffar / {info['misses']} missar sedan start")
+    else: st.caption("Avstängd (ingen skrivbar cachefil)")
+    if st.button("Töm mönstercache"):
+        clear_cache(); st.rerun()
+
     st.divider()
     st.subheader("📋 Inläst lager")
-    if st.session_state.inventory_rows:
-        if st.button("🗑️ Töm allt lager"):
-            st.session_state.inventory_rows = []; st.rerun()
-        for i, item in enumerate(st.session_state.inventory_rows):
-            col_info, col_del = st.columns([4, 1])
-            col_info.write(f"**{item['q']}st** {item['l']}mm")
-            if col_del.button("❌", key=f"del_{item['id']}"):
-                st.session_state.inventory_rows.pop(i); st.rerun()
+    inv = st.session_state.inventory
+    if inventory_size(inv):
+        # En tabell i stället för en rad widgets per lagerrad; markera rader för att ta bort dem
+        st.caption(f"{inventory_size(inv)} rader · {total_boards(inv)} brädor")
+        table = pd.DataFrame({'Paket': np.array(inv['namn'], dtype=object)[inv['pkg']], 'Längd (mm)': inv['l'], 'Antal': inv['q']})
+        event = st.dataframe(table, hide_index=True, use_container_width=True, key="lager_tabell", on_select="rerun", selection_mode="multi-row")
+        selected = event.selection.rows
+        c_del, c_all = st.columns(2)
+        if c_del.button(f"❌ Ta bort markerade ({len(selected)})", disabled=not selected):
+            keep = np.ones(inventory_size(inv), bool); keep[selected] = False
+            st.session_state.inventory = take(inv, keep); st.session_state.pop("lager_tabell", None); st.rerun()
+        if c_all.button("🗑️ Töm allt lager"):
+            st.session_state.inventory = empty_inventory(); st.session_state.pop("lager_tabell", None); st.rerun()
 
 # --- HUVUDYTA ---
 tab1, tab2 = st.tabs(["✂️ Optimering", "💰 Priskalkyl"])
@@ -83,86 +150,133 @@ with tab1:
 
     st.header("🛠️ Strategi")
     col_s1, col_s2, col_s3 = st.columns([2, 1, 1])
-    opt_mode = col_s1.selectbox("Gruppering:", ["Målstyrd (Blanda fritt)", "Brädstyrd (En längd/bräda)", "Poststyrd (Hela paket)", "Längdstyrd (Samma råvarulängd)"])
+    opt_mode = col_s1.selectbox("Gruppering:", list(STRATEGIER), format_func=STRATEGIER.get)
     use_extra = col_s2.toggle("Extra bitar", value=True)
     extra_l = col_s3.number_input("Längd extra (mm)", value=1000)
+    col_b1, col_b2 = st.columns(2)
+    max_nodes = col_b1.number_input("Max noder per mönstersökning (0 = obegränsat)", min_value=0, value=200000, step=10000)
+    time_limit = col_b2.number_input("Max tid per mönstersökning (ms, 0 = obegränsat)", min_value=0, value=0, step=50)
+    col_p1, col_p2, col_p3 = st.columns(3)
+    workers = col_p1.number_input("Processer (1 = seriellt)", min_value=1, max_value=64, value=1, help=f"Servern har {default_workers()} kärnor")
+    compare_serial = col_p2.toggle("Jämför med seriell körning", value=False, disabled=workers == 1, help="Båda körningarna går då utan mönstercache")
+    use_cache = col_p3.toggle("Mönstercache på disk", value=True)
+    auto_update = st.toggle("Uppdatera kaplistan direkt när lager eller mål ändras", value=True,
+                            help="Ändrat lager planeras om direkt (bara de paket/längdklasser som ändrats). Ändrade mål, "
+                                 "strategi eller budget ger en helt ny plan, som körs i bakgrunden som KÖR OPTIMERING")
+    profile_run = st.toggle("Profilera körningen (cProfile)", value=False,
+                            help="Profilen visas under Prestanda. Bara tråden som kör jobbet profileras, inte extra processer")
     kerf = 4; trim = 20
 
-    if st.button("🚀 KÖR OPTIMERING", type="primary", use_container_width=True):
-        if not st.session_state.inventory_rows:
+    inputs = (inventory_signature(st.session_state.inventory), tuple(sorted(st.session_state.target_lengths.items())),
+              opt_mode, use_extra, extra_l, max_nodes, time_limit)
+    replan_ms = None
+
+    def start_job():
+        # Optimeringen körs i bakgrunden; sidan visar förloppet tills jobbet är klart
+        compare = compare_serial and workers > 1
+        job_fn = profiled(run_optimization) if profile_run else run_optimization
+        st.session_state.job_id = submit(job_fn, st.session_state.inventory, dict(st.session_state.target_lengths),
+                                         opt_mode, workers, use_extra, extra_l, kerf, trim, max_nodes, time_limit / 1000,
+                                         use_cache and not compare, compare)
+        # Den gamla planen gäller inte längre; ett avbrutet eller misslyckat jobb får inte lämna kvar den
+        st.session_state.plan = None; st.session_state.plan_inputs = inputs; st.session_state.last_job = None
+
+    if st.button("🚀 KÖR OPTIMERING", type="primary", use_container_width=True, disabled=st.session_state.job_id is not None):
+        if not total_boards(st.session_state.inventory):
             st.error("Lagret är tomt!")
         else:
-            targets = sorted(list(st.session_state.target_lengths.keys()), reverse=True)
-            goal_pcts = st.session_state.target_lengths
-            count_t = {l: 0 for l in targets}; total_c = 0; total_ra = 0; total_nytta = 0; extra_c = 0
-            results = []
-
-            def get_best_pattern(r_l, max_u):
-                best_p, min_w, best_s = [], r_l, -999999
-                def backtrack(rem, cur_p):
-                    nonlocal best_p, min_w, best_s
-                    # Sortering: Prioritera mått som ligger under sin %-nivå. 
-                    # Om mål är 0%, använd minsta spill som sekundär drivkraft.
-                    def score_func(x):
-                        if total_c == 0: return goal_pcts[x]
-                        return goal_pcts[x] - (count_t[x]/total_c*100)
-
-                    sorted_t = sorted(targets, key=score_func, reverse=True)
-                    found = False
-                    for t in sorted_t:
-                        cost = t + (kerf if cur_p else 0)
-                        if cost <= rem:
-                            if t not in cur_p and len(set(cur_p)) >= max_u: continue
-                            found = True; backtrack(rem-cost, cur_p + [t])
-                            if min_w < 10: return
-                    if not found:
-                        # Poängberäkning: Mål + utnyttjandegrad
-                        s = sum(score_func(b) for b in cur_p) * 1000 - rem
-                        if s > best_s: best_s, best_p, min_w = s, cur_p, rem
-                backtrack(r_l - trim, [])
-                return best_p, min_w
-
-            # Kör logiken baserat på valt läge
-            raw_data = st.session_state.inventory_rows
-            if "Längdstyrd" in opt_mode:
-                u_l = set(r['l'] for r in raw_data)
-                items = [{'l': l, 'q': sum(r['q'] for r in raw_data if r['l']==l)} for l in u_l]
-            elif "Poststyrd" in opt_mode:
-                items = raw_data
-            else: # Målstyrd/Brädstyrd - dela upp i enskilda brädor
-                items = []
-                for r in raw_data: items.extend([{'l': r['l'], 'q': 1}] * r['q'])
-
-            for item in items:
-                p, w = get_best_pattern(item['l'], 1 if "Målstyrd" not in opt_mode else 5)
-                p_f = list(p)
-                if use_extra:
-                    while w >= (extra_l + kerf): p_f.append(extra_l); w -= (extra_l + kerf); extra_c += item['q']
-                for _ in range(item['q']):
-                    for b in p_f:
-                        if b in count_t: count_t[b]+=1; total_c+=1
-                    total_ra += item['l']; total_nytta += sum(p_f)
-                results.append((item['l'], tuple(sorted(p_f)), w, item['q']))
-
-            # --- RESULTATVISNING ---
-            st.divider()
-            spill_pct = (1 - (total_nytta / total_ra)) * 100 if total_ra > 0 else 0
-            c1, c2, c3, c4 = st.columns(4)
-            c1.metric("SPILL TOTALT", f"{spill_pct:.2f} %", delta_color="inverse")
-            c2.metric("Råvara", f"{total_ra/1000:.1f} m")
-            c3.metric("Antal huvudbitar", total_c)
-            c4.metric("Extra bitar", extra_c)
-
-            st.header("📋 Kaplista")
-            export_txt = f"KAPLISTA v81.0\nSPILL: {spill_pct:.2f}%\n" + "="*50 + "\n"
-            
-            # Gruppera mönster för snyggare lista
-            final_summary = Counter(results)
-            for (rl, bits, w, _), qty in final_summary.items():
-                row_spill = (w / rl) * 100
-                line = f"{qty} st á {rl} mm --> {list(bits)} (Spill: {int(w)} mm / {row_spill:.1f}%)"
-                export_txt += line + "\n"
-                with st.expander(line):
-                    st.write(f"Mönster: {' + '.join(map(str, bits))} mm")
-            
-            st.download_button("📥 LADDA NER KAPLISTA (TXT)", export_txt, "kaplista.txt", use_container_width=True, type="primary")
+            start_job()
+    elif (auto_update and st.session_state.job_id is None and st.session_state.plan and inventory_size(st.session_state.inventory)
+          and st.session_state.plan_inputs != inputs):
+        if can_replan(st.session_state.plan, st.session_state.target_lengths, opt_mode, use_extra, extra_l, kerf, trim,
+                      max_nodes, time_limit / 1000):
+            # Bara lagret har ändrats sedan förra planen: planera om det som påverkas direkt
+            start = time.perf_counter()
+            st.session_state.plan = replan_inventory(st.session_state.plan, st.session_state.inventory, st.session_state.target_lengths,
+                                                     opt_mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit / 1000, use_cache)
+            st.session_state.plan_inputs = inputs
+            replan_ms = (time.perf_counter() - start) * 1000
+        else:
+            # Mål, strategi eller budget har ändrats: hela planen görs om, som bakgrundsjobb med förlopp och avbryt
+            start_job()
+
+    if st.session_state.job_id is not None:
+        show_job()
+
+    plan = st.session_state.plan
+    last_job = st.session_state.last_job
+    if last_job and last_job['status'] == "fel":
+        st.error(f"Optimeringen misslyckades: {last_job['fel']}")
+    if plan and inventory_size(st.session_state.inventory) and st.session_state.job_id is None:
+        spill_pct, total_ra, search_stats, lp_nytta = plan['spill_pct'], plan['total_ra'], plan['search_stats'], plan['lp_nytta']
+
+        # --- RESULTATVISNING ---
+        st.divider()
+        if plan.get('cancelled'):
+            st.warning(f"Optimeringen avbröts. Planen nedan gäller de {int(plan['parts']['q'].sum())} brädor som hann planeras.")
+        elif st.session_state.plan_inputs != inputs:
+            st.warning("Lagret eller målen har ändrats sedan planen gjordes. Kör optimeringen igen.")
+        c1, c2, c3, c4 = st.columns(4)
+        c1.metric("SPILL TOTALT", f"{spill_pct:.2f} %", delta_color="inverse")
+        c2.metric("Råvara", f"{total_ra/1000:.1f} m")
+        c3.metric("Antal huvudbitar", plan['total_c'])
+        c4.metric("Extra bitar", plan['extra_c'])
+        if replan_ms is not None:
+            st.caption(f"♻️ Planen uppdaterad: {plan['replanned']} av {len(plan['parts']['key'])} paket/längdklasser omplanerade på {replan_ms:.0f} ms")
+        if search_stats.get('searches'):
+            st.caption(f"🔎 {search_stats.get('searches', 0)} mönstersökningar · {search_stats.get('nodes', 0)} noder · {search_stats.get('pruned', 0)} avskurna grenar · {search_stats.get('cutoffs', 0)} avbrutna av budget")
+        if 'cache_hits' in search_stats or 'cache_misses' in search_stats:
+            st.caption(f"🗄️ Mönstercache: {search_stats.get('cache_hits', 0)} träffar / {search_stats.get('cache_misses', 0)} missar i den här körningen")
+        if 'serial' in plan:
+            serial = plan['serial']
+            st.caption(f"⚡ {plan['workers']} processer: {plan['sekunder']:.2f} s mot {serial['sekunder']:.2f} s seriellt (uppsnabbning {serial['sekunder'] / max(plan['sekunder'], 1e-9):.1f}×) · seriellt spill {serial['spill_pct']:.2f} %")
+        if lp_nytta is not None and total_ra > 0:
+            lp_spill = (1 - (lp_nytta / total_ra)) * 100
+            goals = any(p > 0 for p in st.session_state.target_lengths.values())
+            st.caption(f"📉 Undre gräns enligt LP-relaxationen utan procentmål: {lp_spill:.2f} % spill (planen ligger {spill_pct - lp_spill:.2f} "
+                       f"procentenheter över{', varav en del är priset för procentmålen' if goals else ''})")
+
+        st.header("📋 Kaplista")
+        render_start = time.perf_counter()
+        # En rad per mönster i en virtuell tabell; detaljerna visas sida för sida
+        st.dataframe(pattern_table(plan), hide_index=True, use_container_width=True)
+        lines = list(summarize(plan).items())
+        n_pages = page_count(len(lines))
+        sida = st.number_input(f"Sida (av {n_pages})", 1, n_pages, 1, key="kaplista_sida") if n_pages > 1 else 1
+        for (rl, bits, w), qty in page(lines, sida):
+            with st.expander(format_line(rl, bits, w, qty)):
+                st.write(f"Mönster: {' + '.join(map(str, bits))} mm")
+        render_s = time.perf_counter() - render_start
+        
+        # Exporterna skrivs rad för rad från planen, en gång per plan
+        exports = plan_exports(plan)
+        st.download_button("📥 LADDA NER KAPLISTA (TXT)", exports['txt'], "kaplista.txt", "text/plain",
+                           use_container_width=True, type="primary")
+        e1, e2 = st.columns(2)
+        e1.download_button("📥 Kaplista (CSV)", exports['csv'], "kaplista.csv",
+                           "text/csv", use_container_width=True)
+        e2.download_button("📥 Kaplista (Excel)", exports['xlsx'], "kaplista.xlsx",
+                           "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", use_container_width=True)
+
+        # --- PRESTANDA ---
+        with st.expander("⏱️ Prestanda"):
+            stats = {**search_stats, 'sek_rendering': render_s}
+            if st.session_state.import_s is not None: stats['sek_import'] = st.session_state.import_s
+            total_s = plan['sekunder'] + stats['sek_rendering'] + stats.get('sek_import', 0) if 'sekunder' in plan else None
+            report = performance_report(stats, total_s)
+            kvoter = report['kvoter']
+            p1, p2, p3, p4 = st.columns(4)
+            p1.metric("Noder", search_stats.get('nodes', 0))
+            p2.metric("Avskurna grenar", f"{kvoter['avskurna_pct']:.1f} %" if 'avskurna_pct' in kvoter else "–")
+            p3.metric("Cacheträffar", f"{kvoter['cache_traff_pct']:.1f} %" if 'cache_traff_pct' in kvoter else "–")
+            p4.metric("Noder per sökning", kvoter.get('noder_per_sokning', "–"))
+            st.dataframe(pd.DataFrame(report['faser'], columns=['namn', 'sekunder', 'andel_pct']).rename(
+                columns={'namn': "Fas", 'sekunder': "Sekunder", 'andel_pct': "Andel %"}), hide_index=True, use_container_width=True)
+            if plan.get('workers', 1) > 1:
+                st.caption(f"Faserna är summerade över {plan['workers']} processer och kan tillsammans överstiga väggklockan.")
+            st.download_button("📥 Exportera mätningen (JSON)", report_json(report, strategi=opt_mode, processer=plan.get('workers', 1)),
+                               "prestanda.json", "application/json")
+            if 'profil' in plan:
+                st.subheader("cProfile")
+                st.code(plan['profil'])
+                st.download_button("📥 Ladda ner profilen (.prof)", plan['profil_data'], "kapmaskin.prof")
@@ -0,0 +1,16 @@
+# Kapmotorn: optimeringen utan Streamlit, används av apparna och av kommandoraden
+from .packlista import file_digest, iter_chunks, read_inventory, read_package_totals
+from .lager import (empty_inventory, make_inventory, inventory_from_rows, inventory_from_classes, inventory_size, total_boards,
+                    row_keys, iter_rows, take, merge_inventory, stock_classes, inventory_signature, inventory_nbytes)
+from .monster import make_pattern_engine, get_best_pattern
+from .kolumngenerering import solve_global
+from .packning import pack_pieces, pack_stock, stock_pool
+from .planering import (STRATEGIER, plan_inventory, replan_inventory, can_replan, merge_plans, plan_totals, plan_stock, summarize,
+                        format_line, cut_list_lines, iter_export_text, export_text)
+from .kaplista import (PAGE_ROWS, page_count, page, aggregate_planks, plank_table, iter_plank_text, plank_rows, PLANK_HEADER,
+                       pattern_rows, pattern_table, PATTERN_HEADER, iter_csv, to_bytes, write_xlsx)
+from .parallell import default_workers, plan_parallel
+from .cache import cache_info, clear_cache
+from .prestanda import FASER, performance_report, report_json, profiled
+from .priser import ORDER_COLUMNS, REQUIRED, QUOTE_COLUMNS, quote, read_order_book, quote_frame, frame_rows, sensitivity_grid
+from .jobb import submit, job_status, cancel_job, forget, server_load, format_seconds
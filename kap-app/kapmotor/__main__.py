@@ -0,0 +1,75 @@
+import argparse
+import cProfile
+import json
+import sys
+import time
+from pathlib import Path
+
+from .packlista import read_inventory
+from .planering import STRATEGIER, export_text
+from .parallell import plan_parallel
+from .prestanda import performance_report
+
+# --- BATCHKÖRNING FRÅN KOMMANDORADEN ---
+# python -m kapmotor INKORG --ut UTKORG --mal 1060:50,1090:30,1120:20
+# --profil sparar en cProfile-profil per packlista (UTKORG/<namn>.prof, öppnas med pstats/snakeviz)
+
+def parse_targets(text):
+    # "1060:50,1090:30,1120" -> {1060: 50, 1090: 30, 1120: 0}
+    targets = {}
+    for part in filter(None, (p.strip() for p in text.split(','))):
+        l, _, pct = part.partition(':')
+        targets[int(l)] = int(pct or 0)
+    return targets
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="kapmotor", description="Kapoptimering för en katalog med packlistor (.xlsx/.csv).")
+    ap.add_argument("inkorg", type=Path, help="katalog med packlistor")
+    ap.add_argument("--ut", type=Path, default=None, help="katalog för kaplistor och statistik (standard: INKORG/kaplistor)")
+    ap.add_argument("--strategi", choices=list(STRATEGIER), default="malstyrd")
+    ap.add_argument("--mal", type=parse_targets, default=parse_targets("1060,1090,1120"), help="mållängder och mål %%, t.ex. 1060:50,1090:30")
+    ap.add_argument("--extra", type=int, default=1000, help="längd på extra bitar i mm, 0 = inga")
+    ap.add_argument("--kerf", type=int, default=4)
+    ap.add_argument("--trim", type=int, default=20)
+    ap.add_argument("--max-noder", type=int, default=200000, help="max noder per mönstersökning, 0 = obegränsat")
+    ap.add_argument("--processer", type=int, default=1, help="antal processer per packlista, 0 = en per kärna")
+    ap.add_argument("--profil", action="store_true", help="spara en cProfile-profil per packlista")
+    args = ap.parse_args(argv)
+
+    out = args.ut or args.inkorg / "kaplistor"
+    out.mkdir(parents=True, exist_ok=True)
+    files = sorted(p for p in args.inkorg.iterdir() if p.suffix.lower() in (".xlsx", ".csv"))
+    failed = 0
+    for path in files:
+        start = time.perf_counter()
+        prof = cProfile.Profile() if args.profil else None
+        try:
+            if prof: prof.enable()
+            with open(path, "rb") as f:
+                inv = read_inventory(f)
+            import_s = time.perf_counter() - start
+            plan = plan_parallel(inv, args.mal, args.strategi, args.processer, args.extra > 0, args.extra, args.kerf, args.trim, args.max_noder)
+        except Exception as e:
+            failed += 1
+            print(f"FEL {path.name}: {e}", file=sys.stderr)
+            continue
+        finally:
+            if prof: prof.disable()
+        if prof: prof.dump_stats(str(out / f"{path.stem}.prof"))
+        (out / f"{path.stem}_kaplista.txt").write_text(export_text(plan), encoding="utf-8")
+        stats = {
+            'fil': path.name, 'strategi': args.strategi, 'processer': plan['workers'], 'sekunder': round(time.perf_counter() - start, 3),
+            'spill_pct': round(plan['spill_pct'], 3), 'ravara_m': plan['total_ra'] / 1000,
+            'huvudbitar': plan['total_c'], 'extra_bitar': plan['extra_c'],
+            'per_langd': {str(l): n for l, n in plan['count_t'].items()},
+            'lp_spill_pct': round((1 - plan['lp_nytta'] / plan['total_ra']) * 100, 3) if plan['lp_nytta'] is not None and plan['total_ra'] else None,
+            'sokning': plan['search_stats'],
+            'prestanda': performance_report({**plan['search_stats'], 'sek_import': import_s}, time.perf_counter() - start),
+        }
+        (out / f"{path.stem}_stats.json").write_text(json.dumps(stats, ensure_ascii=False, indent=2), encoding="utf-8")
+        print(f"{path.name}: {plan['spill_pct']:.2f} % spill, {plan['total_ra']/1000:.1f} m råvara ({stats['sekunder']} s)")
+    print(f"{len(files) - failed} av {len(files)} packlistor planerade -> {out}")
+    return 1 if failed else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
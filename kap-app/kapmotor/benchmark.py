@@ -0,0 +1,159 @@
+import argparse
+import json
+import platform
+import random
+import sys
+import time
+import tracemalloc
+from datetime import datetime
+from pathlib import Path
+
+from .lager import inventory_from_rows, stock_classes, total_boards
+from .packning import pack_pieces
+from .planering import plan_inventory, plan_stock
+
+# --- PRESTANDAMÄTNING AV KAPMOTORERNA ---
+# python -m kapmotor.benchmark                 full körning, 100 till 1 000 000 brädor
+# python -m kapmotor.benchmark --snabb         röktest på några sekunder (utan minnesmätning)
+# python -m kapmotor.benchmark --jamfor gammal.json
+# Samma frö ger samma lager, så JSON-filerna från olika körningar går att jämföra rad för rad.
+
+STORLEKAR = (100, 1000, 10000, 100000, 1000000)
+MALANTAL = (3, 6, 12)
+SNABB_STORLEKAR = (100, 1000)
+SNABB_MALANTAL = (3, 8)
+MAX_NODER = 20000; SNABB_MAX_NODER = 500
+RAVARULANGDER = tuple(range(3000, 6601, 300))
+RAW_LEN = 6000; KERF = 4; EXTRA = 1000
+
+def generate_inventory(n_boards, n_targets, goals=False, seed=0):
+    """Reproducerbart lager (se lager.py) på n_boards brädor: paket om 50–400 brädor i några av
+    längderna 3000–6600 mm, plus n_targets mållängder {mm: mål %} (mål som summerar till 100 om goals)."""
+    rng = random.Random(f"{seed}-{n_boards}-{n_targets}-{goals}")
+    lengths = rng.sample(RAVARULANGDER, rng.randint(4, 8))
+    rows, left = [], n_boards
+    while left > 0:
+        q = min(left, rng.randint(50, 400)); left -= q
+        rows.append({'id': f"bench_{len(rows)}", 'l': rng.choice(lengths), 'q': q, 'name': f"Paket {len(rows)}"})
+    targets = sorted(rng.sample(range(400, 1500, 10), n_targets))
+    pcts = [0] * n_targets
+    if goals:
+        w = [rng.random() for _ in targets]
+        pcts = [int(100 * x / sum(w)) for x in w]; pcts[0] += 100 - sum(pcts)
+    return inventory_from_rows(rows), dict(zip(targets, pcts))
+
+def _spill(ra, nytta):
+    return (1 - nytta / ra) * 100 if ra > 0 else 0
+
+def run_v44(inv, target_lengths, max_nodes):
+    plan = plan_stock(stock_classes(inv), target_lengths, KERF, 2, sum(target_lengths.values()) > 0, True, EXTRA, 10, 10, use_cache=False)
+    ra = sum(l * n for (l, bits), n in plan['instruktioner'].items())
+    nytta = sum(sum(bits) * n for (l, bits), n in plan['instruktioner'].items())
+    return _spill(ra, nytta), None
+
+def run_v81(inv, target_lengths, max_nodes):
+    plan = plan_inventory(inv, target_lengths, "malstyrd", True, EXTRA, KERF, 20, max_nodes, use_cache=False)
+    return plan['spill_pct'], plan['search_stats'].get('nodes', 0)
+
+def demand(inv, target_lengths):
+    # app.py-efterfrågan som motsvarar lagret: lika många plankor à RAW_LEN fulla med mållängderna
+    n = total_boards(inv); total = sum(target_lengths.values())
+    share = {t: (p / total if total else 1 / len(target_lengths)) for t, p in target_lengths.items()}
+    return {t: max(1, int(n * RAW_LEN * s / (t + KERF))) for t, s in share.items()}
+
+def run_ffd(inv, target_lengths, max_nodes, best_fit=False):
+    behov = demand(inv, target_lengths)
+    plankor = pack_pieces(behov, RAW_LEN, KERF, best_fit)
+    return _spill(len(plankor) * RAW_LEN, sum(t * n for t, n in behov.items())), None
+
+MOTORER = {
+    'v44': run_v44,
+    'v81': run_v81,
+    'ffd': run_ffd,
+    'bfd': lambda inv, t, m: run_ffd(inv, t, m, best_fit=True),
+}
+
+def measure(name, inv, target_lengths, max_nodes, memory=True):
+    # Tid utan tracemalloc (det gör koden flera gånger långsammare), minnestoppen i en andra körning
+    start = time.perf_counter()
+    spill, noder = MOTORER[name](inv, target_lengths, max_nodes)
+    sek = time.perf_counter() - start
+    topp = None
+    if memory:
+        tracemalloc.start()
+        MOTORER[name](inv, target_lengths, max_nodes)
+        topp = tracemalloc.get_traced_memory()[1] / 2**20
+        tracemalloc.stop()
+    return {'sekunder': round(sek, 4), 'topp_minne_mb': None if topp is None else round(topp, 2),
+            'noder': noder, 'spill_pct': round(spill, 3)}
+
+def run_suite(sizes, target_counts, engines, seed=0, max_nodes=MAX_NODER, memory=True, log=print):
+    results = []
+    for n in sizes:
+        for k in target_counts:
+            for goals in (False, True):
+                inv, target_lengths = generate_inventory(n, k, goals, seed)
+                for name in engines:
+                    r = {'motor': name, 'brador': n, 'mallangder': k, 'mal': goals,
+                         **measure(name, inv, target_lengths, max_nodes, memory)}
+                    results.append(r)
+                    if log: log(format_row(r))
+    return results
+
+def format_row(r):
+    minne = "-" if r['topp_minne_mb'] is None else f"{r['topp_minne_mb']:.1f} MB"
+    noder = "-" if r['noder'] is None else r['noder']
+    return (f"{r['motor']:4} {r['brador']:>8} brädor {r['mallangder']:>2} mål {'med %' if r['mal'] else 'fritt':6}"
+            f" {r['sekunder']:9.3f} s {minne:>10} {noder:>9} noder {r['spill_pct']:6.2f} % spill")
+
+def _key(r):
+    return (r['motor'], r['brador'], r['mallangder'], r['mal'])
+
+def compare(results, previous):
+    # Tidskvot och spillskillnad mot en tidigare körning, rad för rad
+    old = {_key(r): r for r in previous}
+    for r in results:
+        o = old.get(_key(r))
+        if o is None: continue
+        kvot = r['sekunder'] / max(o['sekunder'], 1e-9)
+        yield f"{format_row(r)}   tid x{kvot:.2f}, spill {r['spill_pct'] - o['spill_pct']:+.2f}"
+
+def main(argv=None):
+    ap = argparse.ArgumentParser(prog="kapmotor.benchmark", description="Mät kapmotorerna på slumpade men reproducerbara lager.")
+    ap.add_argument("--snabb", action="store_true", help=f"röktest: {SNABB_STORLEKAR} brädor, {SNABB_MALANTAL} mållängder, {SNABB_MAX_NODER} noder, utan minnesmätning")
+    ap.add_argument("--storlekar", default=None, help="antal brädor, t.ex. 100,10000")
+    ap.add_argument("--mallangder", default=None, help="antal mållängder, t.ex. 3,12")
+    ap.add_argument("--motorer", default=",".join(MOTORER), help="urval av " + ", ".join(MOTORER))
+    ap.add_argument("--seed", type=int, default=0)
+    ap.add_argument("--max-noder", type=int, default=None, help=f"nodbudget per mönstersökning i v81 (standard {MAX_NODER})")
+    ap.add_argument("--utan-minne", action="store_true", help="hoppa över minnesmätningen (halverar tiden)")
+    ap.add_argument("--ut", type=Path, default=None, help="JSON-fil (standard: benchmark_<tid>.json)")
+    ap.add_argument("--jamfor", type=Path, default=None, help="tidigare JSON-fil att jämföra med")
+    args = ap.parse_args(argv)
+
+    ints = lambda text: [int(x) for x in text.split(',') if x.strip()]
+    sizes = ints(args.storlekar) if args.storlekar else (SNABB_STORLEKAR if args.snabb else STORLEKAR)
+    target_counts = ints(args.mallangder) if args.mallangder else (SNABB_MALANTAL if args.snabb else MALANTAL)
+    max_nodes = args.max_noder if args.max_noder is not None else (SNABB_MAX_NODER if args.snabb else MAX_NODER)
+    engines = [e for e in args.motorer.split(',') if e]
+    unknown = [e for e in engines if e not in MOTORER]
+    if unknown: ap.error(f"okänd motor: {', '.join(unknown)}")
+
+    start = time.perf_counter()
+    results = run_suite(sizes, target_counts, engines, args.seed, max_nodes, not (args.utan_minne or args.snabb))
+    report = {
+        'datum': datetime.now().isoformat(timespec='seconds'), 'python': platform.python_version(),
+        'maskin': platform.machine(), 'seed': args.seed, 'max_noder': max_nodes,
+        'snabb': args.snabb, 'sekunder_totalt': round(time.perf_counter() - start, 2), 'resultat': results,
+    }
+    out = args.ut or Path(f"benchmark_{datetime.now():%Y%m%d_%H%M%S}.json")
+    out.write_text(json.dumps(report, ensure_ascii=False, indent=2), encoding="utf-8")
+    print(f"{len(results)} mätningar på {report['sekunder_totalt']} s -> {out}")
+    if args.jamfor:
+        previous = json.loads(args.jamfor.read_text(encoding="utf-8"))['resultat']
+        print(f"Jämfört med {args.jamfor}:")
+        for line in compare(results, previous): print(line)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
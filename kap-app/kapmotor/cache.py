@@ -0,0 +1,89 @@
+import os
+import sqlite3
+import threading
+import time
+
+# --- MÖNSTERCACHE PÅ DISK ---
+# Bästa mönster sparas i en SQLite-fil bredvid appen (/app i containern) så att de
+# överlever omstarter och delas mellan sessioner och processer. Nyckeln är allt som
+# avgör sökningens svar, värdet är mönstret och spillet. När filen har fler än
+# MAX_ROWS mönster tas de som använts längst tillbaka bort.
+# KAP_MONSTERCACHE anger filen ("" stänger av cachen), KAP_MONSTERCACHE_MAX antalet mönster.
+CACHE_PATH = os.environ.get("KAP_MONSTERCACHE", os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "monstercache.sqlite"))
+MAX_ROWS = int(os.environ.get("KAP_MONSTERCACHE_MAX", 200000))
+EVICT_EVERY = 1000
+
+_lock = threading.Lock()
+_conn = None; _pid = None; _stored = 0; _broken = False
+_counts = {'hits': 0, 'misses': 0}
+
+def _db():
+    # En anslutning per process (en processpool ärver annars förälderns)
+    global _conn, _pid
+    if _conn is None or _pid != os.getpid():
+        _conn = sqlite3.connect(CACHE_PATH, timeout=30, isolation_level=None, check_same_thread=False)
+        _conn.execute("PRAGMA journal_mode=WAL"); _conn.execute("PRAGMA synchronous=NORMAL")
+        _conn.execute("CREATE TABLE IF NOT EXISTS monster (nyckel TEXT PRIMARY KEY, bitar TEXT, spill, anvand REAL)")
+        _conn.execute("CREATE INDEX IF NOT EXISTS monster_anvand ON monster (anvand)")
+        _pid = os.getpid()
+    return _conn
+
+def active():
+    # Av om KAP_MONSTERCACHE är tom eller om filen inte gick att öppna
+    return bool(CACHE_PATH) and not _broken
+
+def lookup(key):
+    """(mönster, spill) för nyckeln, eller None."""
+    global _broken
+    if not active(): return None
+    with _lock:
+        try:
+            db = _db()
+            row = db.execute("SELECT bitar, spill FROM monster WHERE nyckel = ?", (key,)).fetchone()
+            if row: db.execute("UPDATE monster SET anvand = ? WHERE nyckel = ?", (time.time(), key))
+        except sqlite3.Error:
+            _broken = True
+            return None
+        _counts['hits' if row else 'misses'] += 1
+    if row is None: return None
+    return [int(b) for b in row[0].split(',') if b], row[1]
+
+def store(key, pattern, waste):
+    global _stored
+    if not active(): return
+    with _lock:
+        try:
+            db = _db()
+            db.execute("INSERT OR REPLACE INTO monster VALUES (?, ?, ?, ?)", (key, ",".join(map(str, pattern)), waste, time.time()))
+            _stored += 1
+            if _stored % EVICT_EVERY == 0: _evict(db)
+        except sqlite3.Error:
+            pass
+
+def _evict(db):
+    # Minst nyligen använda först, ner till 90 % av taket så att det inte rensas vid varje lagring
+    n = db.execute("SELECT COUNT(*) FROM monster").fetchone()[0]
+    if n > MAX_ROWS:
+        db.execute("DELETE FROM monster WHERE nyckel IN (SELECT nyckel FROM monster ORDER BY anvand LIMIT ?)", (n - MAX_ROWS * 9 // 10,))
+
+def add_counts(hits, misses):
+    # Träffar/missar från andra processer (parallell körning)
+    with _lock:
+        _counts['hits'] += hits; _counts['misses'] += misses
+
+def cache_info():
+    """Räknare sedan start och antal sparade mönster."""
+    global _broken
+    rows = 0
+    if active():
+        with _lock:
+            try: rows = _db().execute("SELECT COUNT(*) FROM monster").fetchone()[0]
+            except sqlite3.Error: _broken = True
+    return {'path': CACHE_PATH, 'active': active(), 'rows': rows, 'max_rows': MAX_ROWS, **_counts}
+
+def clear_cache():
+    if not active(): return
+    with _lock:
+        try: _db().execute("DELETE FROM monster")
+        except sqlite3.Error: pass
+        _counts['hits'] = _counts['misses'] = 0
@@ -0,0 +1,89 @@
+import itertools
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- BAKGRUNDSJOBB ---
+# Optimeringarna körs i en gemensam kö av trådar i serverprocessen, så att sidan inte
+# låser sig medan de kör och flera användare kan lägga jobb samtidigt. Ett jobb är en
+# funktion som tar progress och cancel (se plan_inventory); det rapporterar brädor
+# klara, spill hittills och planen hittills, och kan avbrytas med planen hittills kvar.
+
+MAX_JOBS = 2          # jobb som kör samtidigt, övriga väntar i kö
+KEEP_S = 3600         # färdiga jobb som ingen hämtat glöms efter en timme
+SNAPSHOT_S = 0.5      # hur ofta planen hittills sparas undan
+
+_lock = threading.Lock()
+_executor = ThreadPoolExecutor(max_workers=MAX_JOBS, thread_name_prefix="kapjobb")
+_jobs = {}
+_ids = itertools.count(1)
+
+def submit(fn, *args, spill_of=lambda plan: plan.get('spill_pct'), **kwargs):
+    """Lägg fn(*args, progress=..., cancel=..., **kwargs) i kön och returnera jobbets id.
+    spill_of(plan) ger spill i % för en (del)plan."""
+    with _lock:
+        _prune()
+        job = {'id': next(_ids), 'status': "i kö", 'skapad': time.time(), 'startad': None, 'klar': None,
+               'done': 0, 'total': 0, 'spill_pct': None, 'plan': None, 'fel': None, 'cancel': threading.Event()}
+        _jobs[job['id']] = job
+
+    def progress(done, total, snapshot):
+        job['done'], job['total'] = done, total
+        now = time.perf_counter()
+        if now - progress.last >= SNAPSHOT_S:
+            progress.last = now
+            plan = snapshot(); job['plan'] = plan; job['spill_pct'] = spill_of(plan)
+    progress.last = 0
+
+    def run():
+        if job['cancel'].is_set():
+            job['status'] = "avbruten"; job['klar'] = time.time(); return
+        job['status'] = "kör"; job['startad'] = time.time()
+        try:
+            plan = fn(*args, progress=progress, cancel=job['cancel'], **kwargs)
+            job['plan'] = plan; job['spill_pct'] = spill_of(plan)
+            job['status'] = "avbruten" if plan.get('cancelled') else "klar"
+        except Exception as e:
+            job['status'] = "fel"; job['fel'] = str(e)
+        job['klar'] = time.time()
+
+    _executor.submit(run)
+    return job['id']
+
+def _prune():
+    now = time.time()
+    for k in [k for k, j in _jobs.items() if j['klar'] and now - j['klar'] > KEEP_S]:
+        del _jobs[k]
+
+def job_status(job_id):
+    """Kopia av jobbets läge med plats i kön ('ko') och beräknad tid kvar ('eta_s'), eller None."""
+    with _lock:
+        job = _jobs.get(job_id)
+        if job is None: return None
+        status = {k: v for k, v in job.items() if k != 'cancel'}
+        status['ko'] = sum(1 for j in _jobs.values() if j['status'] == "i kö" and j['id'] < job_id) + 1 if job['status'] == "i kö" else 0
+    status['eta_s'] = None
+    if status['startad'] and 0 < status['done'] < status['total']:
+        elapsed = time.time() - status['startad']
+        status['eta_s'] = elapsed * (status['total'] - status['done']) / status['done']
+    return status
+
+def cancel_job(job_id):
+    with _lock:
+        job = _jobs.get(job_id)
+        if job: job['cancel'].set()
+
+def forget(job_id):
+    with _lock:
+        _jobs.pop(job_id, None)
+
+def server_load():
+    # (jobb som kör, jobb i kö) för alla användare
+    with _lock:
+        states = [j['status'] for j in _jobs.values()]
+    return states.count("kör"), states.count("i kö")
+
+def format_seconds(s):
+    if s is None: return "–"
+    s = int(round(s))
+    return f"{s // 60} min {s % 60} s" if s >= 60 else f"{s} s"
@@ -0,0 +1,88 @@
+import csv
+import io
+from itertools import repeat
+
+import pandas as pd
+
+from .planering import summarize
+
+# --- KAPLISTOR: SAMMANSTÄLLNING OCH EXPORT ---
+# Stora planer visas som en rad per unikt mönster (identiska plankor/brädor slås ihop)
+# och detaljerna sida för sida, så att sidan ritas lika fort oavsett planens storlek.
+# Exporterna (CSV/XLSX/TXT) skrivs rad för rad från generatorer i stället för att
+# planen byggs upp som en enda sträng.
+
+PAGE_ROWS = 50
+
+def page_count(n, per=PAGE_ROWS):
+    return max(1, -(-n // per))
+
+def page(items, k, per=PAGE_ROWS):
+    # Sida k (från 1) av items
+    return items[(k - 1) * per:k * per]
+
+# --- app.py: plankor från packningen ---
+def aggregate_planks(plankor, raw_len):
+    """[(råvarulängd, bitar, antal plankor, spill %)] där identiska plankor (samma längd och bitar)
+    är en rad, i den ordning mönstren först förekommer. raw_len är plankornas längd, eller en
+    lista med längden för varje planka (pack_stock)."""
+    groups = {}
+    for p, rl in zip(plankor, raw_len if isinstance(raw_len, list) else repeat(raw_len)):
+        key = (rl, tuple(sorted(p, reverse=True)))
+        groups[key] = groups.get(key, 0) + 1
+    return [(rl, bits, n, (1 - sum(bits) / rl) * 100) for (rl, bits), n in groups.items()]
+
+PLANK_HEADER = ("Antal plankor", "Råvarulängd (mm)", "Bitar (mm)", "Använt (mm)", "Spill %", "Inom max-spill")
+
+def plank_rows(groups, target_waste):
+    for rl, bits, n, spill in groups:
+        yield n, rl, " + ".join(map(str, bits)), sum(bits), round(spill, 1), "ja" if spill <= target_waste else "nej"
+
+def plank_table(groups, target_waste):
+    return pd.DataFrame(list(plank_rows(groups, target_waste)), columns=PLANK_HEADER)
+
+def iter_plank_text(groups, target_waste):
+    lengths = ", ".join(map(str, sorted({rl for rl, bits, n, spill in groups}, reverse=True)))
+    yield f"KAPSCHEMA\nRÅMATERIAL: {lengths} mm\nPLANKOR: {sum(n for rl, bits, n, spill in groups)}\n" + "=" * 50 + "\n"
+    for n, rl, bits, used, spill, ok in plank_rows(groups, target_waste):
+        yield f"{n} st plankor á {rl} mm --> {bits} mm (Spill: {spill:.1f}%){'' if ok == 'ja' else ' ⚠️'}\n"
+
+# --- v81: mönster från kapplanen ---
+PATTERN_HEADER = ("Antal", "Råvarulängd (mm)", "Bitar (mm)", "Spill (mm)", "Spill %")
+
+def pattern_rows(plan):
+    for (rl, bits, w), qty in summarize(plan).items():
+        yield qty, rl, " + ".join(map(str, bits)), int(w), round((w / rl) * 100, 1)
+
+def pattern_table(plan):
+    return pd.DataFrame(list(pattern_rows(plan)), columns=PATTERN_HEADER)
+
+# --- STRÖMMANDE EXPORT ---
+def iter_csv(header, rows, chunk_bytes=1 << 16):
+    # Semikolon och decimalkomma, som svenska Excel förväntar sig; texten lämnas i block
+    buf = io.StringIO()
+    writer = csv.writer(buf, delimiter=";", lineterminator="\r\n")
+    writer.writerow(header)
+    for row in rows:
+        writer.writerow([str(v).replace('.', ',') if isinstance(v, float) else v for v in row])
+        if buf.tell() >= chunk_bytes:
+            yield buf.getvalue(); buf.seek(0); buf.truncate()
+    yield buf.getvalue()
+
+def to_bytes(chunks, bom=False):
+    """Textblock från en generator som bytes (bom=True för CSV som ska öppnas i Excel)."""
+    out = io.BytesIO()
+    if bom: out.write("\ufeff".encode("utf-8"))
+    for chunk in chunks: out.write(chunk.encode("utf-8"))
+    return out.getvalue()
+
+def write_xlsx(header, rows, sheet="Kaplista"):
+    # openpyxl i write-only-läge skriver raderna direkt i stället för att bygga arket i minnet
+    from openpyxl import Workbook
+    wb = Workbook(write_only=True)
+    ws = wb.create_sheet(sheet)
+    ws.append(list(header))
+    for row in rows: ws.append(list(row))
+    out = io.BytesIO()
+    wb.save(out)
+    return out.getvalue()
@@ -0,0 +1,165 @@
+import numpy as np
+
+# --- GLOBAL OPTIMERING (kolumngenerering enligt Gilmore–Gomory) ---
+try:
+    from scipy.optimize import linprog
+except ImportError:
+    linprog = None
+
+def _simplex(c, A, b, basis):
+    # Primal simplex med Blands regel (max c·x, A x = b, x >= 0); basis måste vara tillåten från start
+    basis = list(basis)
+    while True:
+        B = A[:, basis]
+        x_b = np.linalg.solve(B, b)
+        y = np.linalg.solve(B.T, c[basis])
+        red = c - y @ A
+        red[basis] = 0
+        cand = np.nonzero(red > 1e-7)[0]
+        if not len(cand): break
+        j = cand[0]
+        d = np.linalg.solve(B, A[:, j])
+        rows = np.nonzero(d > 1e-9)[0]
+        if not len(rows): break  # Obegränsat, kan inte hända när alla brädor ska kapas
+        ratios = x_b[rows] / d[rows]
+        best = ratios.min()
+        r = min((basis[k], k) for k, q in zip(rows, ratios) if q <= best + 1e-9)[1]
+        basis[r] = j
+    x = np.zeros(A.shape[1]); x[basis] = np.maximum(x_b, 0)
+    return x, y
+
+def _solve_master(P, cost, a, m_s):
+    # max cost·x där raderna 0..m_s-1 är lagret (= a) och övriga rader är målvillkor (<= 0).
+    # De första m_s kolumnerna är de tomma mönstren, vilket ger en tillåten startbas.
+    m_g = P.shape[0] - m_s
+    if linprog is not None:
+        res = linprog(-cost, A_ub=P[m_s:] if m_g else None, b_ub=np.zeros(m_g) if m_g else None,
+                      A_eq=P[:m_s], b_eq=a, bounds=(0, None), method="highs")
+        if res.status == 0:
+            y_ub = -res.ineqlin.marginals if m_g else np.zeros(0)
+            return res.x, np.concatenate([-res.eqlin.marginals, y_ub])
+    A = np.hstack([P, np.vstack([np.zeros((m_s, m_g)), np.eye(m_g)])])
+    x, y = _simplex(np.concatenate([cost, np.zeros(m_g)]), A, np.concatenate([a, np.zeros(m_g)]),
+                    list(range(m_s)) + list(range(P.shape[1], P.shape[1] + m_g)))
+    return x[:P.shape[1]], y
+
+def _with_item(f, w, v):
+    # h[c] = max över n >= 1 av f[c - n*w] + n*v, som kumulativt max per rest modulo w
+    n = len(f); K = -(-n // w)
+    pad = np.full(K * w, -np.inf); pad[:n] = f
+    k = np.arange(K)[:, None]
+    cm = np.maximum.accumulate(pad.reshape(K, w) - k * v, axis=0)
+    h = np.full((K, w), -np.inf)
+    h[1:] = cm[:-1] + k[1:] * v
+    return h.reshape(-1)[:n]
+
+def _price(values, weights, max_u, cap, extra):
+    # Obegränsad ryggsäck med högst max_u unika mållängder; extrabiten räknas inte som unik
+    base = np.zeros(cap + 1)
+    if extra: base = (np.arange(cap + 1) // extra[0]) * float(extra[1])
+    layers = [[base] * (max_u + 1)]
+    for v, w in zip(values, weights):
+        prev = layers[-1]
+        cur = [prev[0]]
+        for b in range(1, max_u + 1):
+            cur.append(np.maximum(prev[b], _with_item(prev[b - 1], w, v)) if v > 0 and w <= cap else prev[b])
+        layers.append(cur)
+    return layers
+
+def _recover(layers, values, weights, max_u, c, extra):
+    # Gå baklänges genom lagren och plocka ut antal per mållängd för kapaciteten c
+    counts = [0] * len(values); b = max_u
+    for j in range(len(values) - 1, -1, -1):
+        cur, prev = layers[j + 1][b], layers[j][b]
+        if b == 0 or cur[c] <= prev[c] + 1e-9: continue
+        w, v = weights[j], values[j]
+        ns = np.arange(1, c // w + 1)
+        n = int(ns[np.argmax(layers[j][b - 1][c - ns * w] + ns * v)])
+        counts[j] = n; c -= n * w; b -= 1
+    return tuple(counts), (c // extra[0] if extra else 0)
+
+def lp_bound(stock, targets, kerf, trim, max_u, extra_l=None):
+    """Största möjliga nyttiga längd (mm) för lagret {längd: antal}, dvs. LP-relaxationen utan
+    procentmål och därmed en undre gräns för spillet i varje plan med högst max_u unika
+    mållängder per bräda. Utan mål delas LP:n upp per råvarulängd: varje bräda får det
+    bästa mönstret, så gränsen är ryggsäckens optimum gånger antalet brädor."""
+    lengths = sorted(l for l, q in stock.items() if q > 0)
+    if not lengths or not targets: return 0.0
+    caps = [max(0, l - trim + kerf) for l in lengths]
+    # Extrabitarna fyller resten av brädan även när extralängden också är en mållängd
+    extra = (extra_l + kerf, extra_l) if extra_l else None
+    top = _price([float(t) for t in targets], [t + kerf for t in targets], max_u, max(caps), extra)[-1][max_u]
+    return float(sum(stock[l] * top[cap] for l, cap in zip(lengths, caps)))
+
+def solve_global(stock, targets, goal_pcts, kerf, trim, max_u, extra_l=None, max_iter=200):
+    """Kolumngenerering: LP-master över kapmönster per råvarulängd, ryggsäck som prissättning.
+
+    stock är {längd: antal}. Alla brädor kapas; målprocenten är mjuka villkor med
+    straff så att LP:n alltid är lösbar. Returnerar (plan, lp_nytta) där plan är
+    [(längd, bitar, spill, antal, extrabitar)] och lp_nytta är den nyttiga längden (mm)
+    i LP-lösningen. Med procentmål byter LP:n nyttig längd mot straffet för brist mot
+    målen, så lp_nytta är då ingen gräns; använd lp_bound för det. Är extralängden också
+    en mållängd räknas extrabitarna mot det målet, som i den giriga planen.
+    """
+    lengths = sorted(l for l, q in stock.items() if q > 0)
+    a = np.array([stock[l] for l in lengths], float)
+    goals = [t for t in targets if goal_pcts.get(t, 0) > 0]
+    # Mål över 100 % totalt tolkas som andelar av summan
+    g = np.array([goal_pcts[t] for t in goals], float) / max(100, sum(goal_pcts.get(t, 0) for t in targets))
+    caps = [max(0, l - trim + kerf) for l in lengths]
+    weights = [t + kerf for t in targets]
+    # Extrabiten är en egen post som fyller resten av brädan och inte räknas som unik längd
+    extra = (extra_l + kerf, extra_l) if extra_l else None
+    e_idx = targets.index(extra_l) if extra_l in targets else None
+    m_s, m_g = len(lengths), len(goals)
+    if not m_s: return [], 0
+
+    # Kolumner: (råvaruindex, antal per mållängd, extrabitar); None = brist mot ett mål
+    columns, P, cost = [], [], []
+    def add_column(i, counts, n_extra):
+        col = np.zeros(m_s + m_g); col[i] = 1
+        own = [n + (n_extra if j == e_idx else 0) for j, n in enumerate(counts)]
+        total = sum(own)
+        for k, t in enumerate(goals): col[m_s + k] = g[k] * total - own[targets.index(t)]
+        columns.append((i, counts, n_extra)); P.append(col)
+        cost.append(float(sum(n * t for n, t in zip(counts, targets)) + n_extra * (extra_l or 0)))
+    for i in range(m_s): add_column(i, (0,) * len(targets), 0)
+    penalty = float(max(lengths))
+    for k in range(m_g):
+        col = np.zeros(m_s + m_g); col[m_s + k] = -1
+        columns.append(None); P.append(col); cost.append(-penalty)
+
+    seen = set(columns)
+    for _ in range(max_iter):
+        x, y = _solve_master(np.array(P).T, np.array(cost), a, m_s)
+        y_goal = y[m_s:]
+        shift = float(g @ y_goal) if m_g else 0.0
+        values = [t - shift + (y_goal[goals.index(t)] if t in goals else 0.0) for t in targets]
+        if extra and e_idx is not None: extra = (extra[0], values[e_idx])
+        layers = _price(values, weights, max_u, max(caps), extra)
+        added = False
+        for i, cap in enumerate(caps):
+            if layers[-1][max_u][cap] - y[i] > 1e-6:
+                counts, n_extra = _recover(layers, values, weights, max_u, cap, extra)
+                if (i, counts, n_extra) not in seen:
+                    seen.add((i, counts, n_extra)); add_column(i, counts, n_extra); added = True
+        if not added: break
+
+    lp_nytta = sum(x[j] * cost[j] for j, col in enumerate(columns) if col is not None)
+
+    # Avrunda till heltal: golv per mönster, resten fördelas efter största decimaldel
+    plan = []
+    for i, l in enumerate(lengths):
+        idx = [j for j, col in enumerate(columns) if col is not None and col[0] == i]
+        qty = {j: int(np.floor(x[j] + 1e-9)) for j in idx}
+        left = int(a[i]) - sum(qty.values())
+        for j in sorted(idx, key=lambda j: x[j] - qty[j], reverse=True)[:max(0, left)]: qty[j] += 1
+        for j in idx:
+            if qty[j] <= 0: continue
+            _, counts, n_extra = columns[j]
+            bits = [t for n, t in zip(counts, targets) for _ in range(n)]
+            avail = l - trim
+            if not bits and extra: n_extra = max(0, avail) // extra[0]
+            w = avail - sum(bits) - max(0, len(bits) - 1) * kerf - n_extra * (extra[0] if extra else 0)
+            plan.append((l, tuple(sorted(bits + [extra_l] * n_extra)), w, qty[j], n_extra))
+    return plan, lp_nytta
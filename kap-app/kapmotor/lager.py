@@ -0,0 +1,81 @@
+import hashlib
+
+import numpy as np
+
+# --- LAGRET SOM KOLUMNER ---
+# En rad per (paket, längd), lagrad som NumPy-kolumner i stället för en dict per rad:
+#   'l'     råvarulängd (mm)
+#   'q'     antal brädor
+#   'pkg'   index i paketlistorna nedan
+#   'paket' unik nyckel per paket (fil + paketnamn), 'namn' visningsnamn
+# Radens id (för Poststyrd och omplanering) är f"{paket}_{l}", samma som de gamla radernas id.
+
+def empty_inventory():
+    return {'l': np.zeros(0, np.int32), 'q': np.zeros(0, np.int64), 'pkg': np.zeros(0, np.int32), 'paket': [], 'namn': []}
+
+def make_inventory(l, q, pkg, paket, namn):
+    return {'l': np.asarray(l, np.int32), 'q': np.asarray(q, np.int64), 'pkg': np.asarray(pkg, np.int32),
+            'paket': list(paket), 'namn': list(namn)}
+
+def inventory_from_rows(rows):
+    """Lager ur rader {'id', 'l', 'q', 'name'}; varje rad blir ett eget paket med radens id som nyckel."""
+    rows = list(rows)
+    return make_inventory([r['l'] for r in rows], [r['q'] for r in rows], np.arange(len(rows)),
+                          [r.get('id', str(i)) for i, r in enumerate(rows)], [r.get('name', "") for r in rows])
+
+def inventory_from_classes(classes):
+    # Ett "paket" per längdklass {längd: antal}
+    return make_inventory(list(classes), list(classes.values()), np.arange(len(classes)),
+                          [str(l) for l in classes], [f"{l} mm" for l in classes])
+
+def inventory_size(inv):
+    return len(inv['l'])
+
+def total_boards(inv):
+    return int(inv['q'].sum())
+
+def row_keys(inv):
+    return [f"{inv['paket'][p]}_{l}" for p, l in zip(inv['pkg'].tolist(), inv['l'].tolist())]
+
+def iter_rows(inv):
+    # Raderna som {'id', 'l', 'q', 'name'} en i taget (Poststyrd planerar rad för rad)
+    for key, l, q, p in zip(row_keys(inv), inv['l'].tolist(), inv['q'].tolist(), inv['pkg'].tolist()):
+        yield {'id': key, 'l': l, 'q': q, 'name': inv['namn'][p]}
+
+def take(inv, idx):
+    """Delmängd av raderna (index eller mask); paketlistorna krymps till de paket som finns kvar."""
+    idx = np.asarray(idx)
+    if idx.dtype == bool: idx = np.flatnonzero(idx)
+    used, pkg = np.unique(inv['pkg'][idx], return_inverse=True)
+    return make_inventory(inv['l'][idx], inv['q'][idx], pkg, [inv['paket'][p] for p in used.tolist()],
+                          [inv['namn'][p] for p in used.tolist()])
+
+def merge_inventory(inv, new):
+    """inv plus de paket i new som inte redan finns (samma fil ger samma nycklar, så en ny import
+    av samma fil lägger inte till dubbletter)."""
+    known = set(inv['paket'])
+    keep = np.array([k not in known for k in new['paket']], bool)
+    if not keep.any(): return inv
+    new = take(new, keep[new['pkg']])
+    offset = len(inv['paket'])
+    return make_inventory(np.concatenate([inv['l'], new['l']]), np.concatenate([inv['q'], new['q']]),
+                          np.concatenate([inv['pkg'], new['pkg'] + offset]), inv['paket'] + new['paket'], inv['namn'] + new['namn'])
+
+def stock_classes(inv):
+    """{längd: antal} i den ordning längderna först dyker upp i lagret (rader med antal > 0)."""
+    pos = inv['q'] > 0
+    l, q = inv['l'][pos], inv['q'][pos]
+    u, first, inverse = np.unique(l, return_index=True, return_inverse=True)
+    sums = np.bincount(inverse.ravel(), weights=q, minlength=len(u))
+    order = np.argsort(first, kind='stable')
+    return {int(u[i]): int(sums[i]) for i in order}
+
+def inventory_signature(inv):
+    # Fingeravtryck av raderna; ändras när en rad läggs till, tas bort eller får nytt antal
+    h = hashlib.blake2b(digest_size=16)
+    for col in ('l', 'q', 'pkg'): h.update(np.ascontiguousarray(inv[col]).tobytes())
+    h.update("\0".join(inv['paket']).encode())
+    return h.hexdigest()
+
+def inventory_nbytes(inv):
+    return sum(inv[c].nbytes for c in ('l', 'q', 'pkg')) + sum(len(s) for s in inv['paket']) + sum(len(s) for s in inv['namn'])
@@ -0,0 +1,148 @@
+import time
+
+from . import cache as disk_cache
+from .prestanda import add_time, count
+
+# --- MÖNSTERMOTOR (DP över millimeterlängder) ---
+def _closure(bits, w, cap, mask):
+    # Alla summor som nås genom att lägga till valfritt antal bitar med vikten w
+    step = w
+    while step <= cap:
+        bits |= (bits << step) & mask
+        step *= 2
+    return bits
+
+def make_pattern_engine(kerf, max_unique, cache=False, stats=None):
+    """Samma svar som den gamla rekursiva sökningen, men varje (längd, ordning) räknas bara en gång.
+    Med cache=True slås mönster också upp i (och sparas till) mönstercachen på disk.
+    Räknare och tider (se prestanda.py) läggs i stats om den ges.
+
+    En bit kostar t + kerf, och en planka med tillgänglig längd `avail` rymmer
+    avail + kerf (första biten har inget sågsnitt framför sig). Tabellerna
+    är bitmängder (Python-int) där bit s betyder att summan s går att nå.
+    """
+    table_cache = {}
+    pattern_cache = {}
+
+    def tables(order, cap):
+        key = (order, cap)
+        if key not in table_cache:
+            mask = (1 << (cap + 1)) - 1
+            n = len(order)
+            # reach[s][b]: summor som nås med högst b unika längder ur order[s:]
+            # incl[s][b]: samma, men där order[s] får användas fritt utöver de b
+            reach = [[1] * (max_unique + 1) for _ in range(n + 1)]
+            incl = [[0] * (max_unique + 1) for _ in range(n)]
+            for s in range(n - 1, -1, -1):
+                w = order[s] + kerf
+                for b in range(max_unique + 1):
+                    incl[s][b] = _closure(reach[s + 1][b], w, cap, mask) if w > 0 else reach[s + 1][b]
+                    reach[s][b] = reach[s + 1][b] | (incl[s][b - 1] if b > 0 else 0)
+            table_cache[key] = (reach, incl)
+            if stats is not None: count(stats, 'tabeller')
+        return table_cache[key]
+
+    def best_pattern(avail, order):
+        key = (avail, order)
+        if stats is not None:
+            count(stats, 'searches')
+            count(stats, 'minne_traffar', key in pattern_cache)
+        t = time.perf_counter()
+        disk_key = f"v44|{avail}|{kerf}|{max_unique}|{','.join(map(str, order))}" if cache and disk_cache.active() else None
+        if key not in pattern_cache and disk_key:
+            hit = disk_cache.lookup(disk_key)
+            if hit: pattern_cache[key] = (tuple(hit[0]), hit[1])
+            if stats is not None: count(stats, 'cache_hits' if hit else 'cache_misses'); t = add_time(stats, 'sek_cache', t)
+        if key not in pattern_cache:
+            cap = avail + kerf
+            pattern = []
+            waste = avail
+            if cap > 0 and order and max_unique > 0:
+                reach, incl = tables(order, cap)
+                best_w = reach[0][max_unique].bit_length() - 1
+                if best_w > 0:
+                    # Bygg det mönster som kommer först i prioritetsordning, exakt som
+                    # den gamla djupet-först-sökningen skulle ha hittat det.
+                    rem, used, j = best_w, 0, 0
+                    while rem:
+                        for k in range(j, len(order)):
+                            w = order[k] + kerf
+                            u = used + (1 if not pattern or k != j else 0)
+                            if w > rem or u > max_unique: continue
+                            if (incl[k][max_unique - u] >> (rem - w)) & 1:
+                                pattern.append(order[k]); rem -= w; used = u; j = k
+                                break
+                    waste = cap - best_w
+            pattern_cache[key] = (tuple(pattern), waste)
+            if stats is not None: t = add_time(stats, 'sek_dp', t)
+            if disk_key:
+                disk_cache.store(disk_key, pattern, waste)
+                if stats is not None: add_time(stats, 'sek_cache', t)
+        pattern, waste = pattern_cache[key]
+        return list(pattern), waste
+
+    return best_pattern
+
+# --- MÖNSTERSÖKNING ---
+def get_best_pattern(r_l, max_u, targets, goal_pcts, count_t, total_c, kerf, trim, max_nodes=0, time_limit=0, stats=None,
+                     cache=False, cancel=None):
+    """Gren-och-begränsa över kapmönster. Samma svar som en fullständig sökning så länge
+    budgeten (max_nodes noder / time_limit sekunder, 0 = obegränsat) inte tar slut;
+    annars returneras det bästa mönstret hittills. Räknare läggs i stats om den ges.
+    Med cache=True används mönstercachen på disk; sökningar som avbröts av tidsgränsen sparas inte.
+    cancel (threading.Event) avbryter sökningen som en uttömd budget."""
+    t = time.perf_counter()
+    best_p, min_w, best_s = [], r_l, -999999
+    # Sortering: Prioritera mått som ligger under sin %-nivå. 
+    # Om mål är 0%, använd minsta spill som sekundär drivkraft.
+    def score_func(x):
+        if total_c == 0: return goal_pcts[x]
+        return goal_pcts[x] - (count_t[x]/total_c*100)
+
+    score = {t: score_func(t) for t in targets}
+    sorted_t = sorted(targets, key=score.get, reverse=True)
+    # Högsta möjliga poäng per mm kapacitet för varje bit (biten minskar också spillet)
+    gain = {t: 1 + 1000 * score[t] / max(1, t if score[t] > 0 else t + kerf) for t in targets}
+    # Svaret bestäms helt av längd, mållängdernas poäng, sågsnitt, renskär, max unika och nodbudget
+    if stats is not None: t = add_time(stats, 'sek_poang', t)
+    disk_key = None
+    if cache and disk_cache.active():
+        disk_key = f"v81|{r_l}|{max_u}|{kerf}|{trim}|{max_nodes}|" + ",".join(f"{x}:{score[x]!r}" for x in sorted(targets))
+        hit = disk_cache.lookup(disk_key)
+        if stats is not None:
+            count(stats, 'cache_hits' if hit else 'cache_misses'); t = add_time(stats, 'sek_cache', t)
+        if hit: return hit
+    deadline = time.perf_counter() + time_limit if time_limit else None
+    nodes = pruned = 0; stop = cutoff = False
+
+    def backtrack(rem, cur_p, cur_s, used):
+        nonlocal best_p, min_w, best_s, nodes, pruned, stop, cutoff
+        nodes += 1
+        if (max_nodes and nodes >= max_nodes) or (nodes % 1024 == 0 and ((deadline and time.perf_counter() > deadline) or (cancel and cancel.is_set()))):
+            stop = cutoff = True
+        open_t = [t for t in sorted_t if t + (kerf if cur_p else 0) <= rem and (t in used or len(used) < max_u)]
+        if not open_t:
+            # Poängberäkning: Mål + utnyttjandegrad
+            s = cur_s * 1000 - rem
+            if s > best_s: best_s, best_p, min_w = s, cur_p, rem
+            return
+        if stop: return
+        # Ingen gren härifrån kan slå bästa hittills
+        if cur_s * 1000 - rem + max(0, rem * max(gain[t] for t in open_t)) + 1e-6 <= best_s:
+            pruned += 1; return
+        for t in open_t:
+            backtrack(rem - t - (kerf if cur_p else 0), cur_p + [t], cur_s + score[t], used | {t})
+            if min_w < 10: stop = True
+            if stop: return
+
+    backtrack(r_l - trim, [], 0, frozenset())
+    if stats is not None: t = add_time(stats, 'sek_backtrack', t)
+    if disk_key and not (cutoff and (time_limit or cancel)):
+        disk_cache.store(disk_key, best_p, min_w)
+        if stats is not None: add_time(stats, 'sek_cache', t)
+    if stats is not None:
+        stats['searches'] = stats.get('searches', 0) + 1
+        stats['nodes'] = stats.get('nodes', 0) + nodes
+        stats['pruned'] = stats.get('pruned', 0) + pruned
+        stats['cutoffs'] = stats.get('cutoffs', 0) + cutoff
+    return best_p, min_w
@@ -0,0 +1,128 @@
+import hashlib
+import re
+import numpy as np
+import pandas as pd
+
+from .lager import empty_inventory, make_inventory
+
+# --- STRÖMMANDE INLÄSNING AV PACKLISTOR ---
+# Stora lagerexporter läses block för block så att hela arket aldrig ligger i minnet.
+
+CHUNK_ROWS = 5000
+
+def file_digest(file):
+    # Innehållshash av filen, läst i bitar
+    h = hashlib.sha1()
+    file.seek(0)
+    for block in iter(lambda: file.read(1 << 20), b""):
+        h.update(block)
+    file.seek(0)
+    return h.hexdigest()[:12]
+
+def _text(v):
+    # Cellvärde som text: 1001 och 1001.0 blir båda "1001", tom cell förblir None
+    if v is None: return None
+    return str(int(v)) if isinstance(v, float) and v.is_integer() else str(v)
+
+def iter_chunks(file, chunk_rows=CHUNK_ROWS, progress=None, text_col=None):
+    """Ger filen som DataFrames om högst chunk_rows rader med samma kolumnrubriker som
+    pd.read_excel/pd.read_csv. progress anropas med andel inläst (0–1) efter varje block.
+    text_col(rubriker) ger positionen för en kolumn som läses som text (t.ex. paketnamnet),
+    så att samma värde blir samma text i alla block även om ett block har tomma celler."""
+    file.seek(0)
+    if file.name.endswith('.csv'):
+        size = max(1, file.seek(0, 2)); file.seek(0)
+        header = list(pd.read_csv(file, nrows=0).columns); file.seek(0)
+        pos = text_col(header) if text_col else None
+        dtype = {header[pos]: str} if pos is not None and pos < len(header) else None
+        for chunk in pd.read_csv(file, chunksize=chunk_rows, dtype=dtype):
+            yield chunk
+            if progress: progress(min(1.0, file.tell() / size))
+    else:
+        from openpyxl import load_workbook
+        wb = load_workbook(file, read_only=True, data_only=True)
+        try:
+            ws = wb.active
+            rows = ws.iter_rows(values_only=True)
+            header = list(next(rows, ()))
+            total = max(1, (ws.max_row or 1) - 1)
+            block, done = [], 0
+            width = len(header)
+            pos = text_col(header) if text_col else None
+            for row in rows:
+                row = row[:width] + (None,) * (width - len(row))
+                if pos is not None and pos < width: row = row[:pos] + (_text(row[pos]),) + row[pos + 1:]
+                block.append(row)
+                if len(block) == chunk_rows:
+                    done += len(block)
+                    yield pd.DataFrame(block, columns=header)
+                    block = []
+                    if progress: progress(min(1.0, done / total))
+            if block:
+                yield pd.DataFrame(block, columns=header)
+        finally:
+            wb.close()
+    if progress: progress(1.0)
+
+def _header_mm(header_val):
+    # Kolumnrubrik i meter (4.2) eller mm (4200) -> mm, None om det inte är en längd
+    try:
+        raw_l = float(header_val)
+        return int(round(raw_l * 1000)) if raw_l < 100 else int(round(raw_l))
+    except: return None
+
+def read_inventory(file, progress=None):
+    """Lagret (se lager.py) ur en packlista med längderna i kolumn D–S och paketnamnet
+    i kolumn B. Antalen summeras per (paket, längd)."""
+    file_id = file_digest(file)
+    # Antal per (paket, längd) för varje block; blocken vikas ihop på slutet
+    parts = []; cols = None; offset = 0
+    name_col = lambda header: 1 if len(header) > 1 else None
+    for chunk in iter_chunks(file, progress=progress, text_col=name_col):
+        if cols is None:
+            # Längdkolumnerna (D–S): rubriken tolkas en gång per kolumn
+            cols = [(c, _header_mm(chunk.columns[c])) for c in range(3, min(19, len(chunk.columns)))]
+            cols = [(c, l) for c, l in cols if l is not None]
+            if not cols: return empty_inventory()
+            lengths = np.array([l for _, l in cols])
+        qty = chunk.iloc[:, [c for c, _ in cols]].apply(pd.to_numeric, errors='coerce').to_numpy(float)
+        names = chunk.iloc[:, 1].astype(object).fillna('nan').astype(str).to_numpy() if len(chunk.columns) > 1 else (np.arange(len(chunk)) + offset).astype(str)
+        offset += len(chunk)
+        row_idx, col_pos = np.nonzero(qty > 0)
+        part = pd.DataFrame({'name': names[row_idx], 'l': lengths[col_pos], 'q': np.trunc(qty[row_idx, col_pos]).astype(np.int64)})
+        parts.append(part.groupby(['name', 'l'], sort=False, as_index=False)['q'].sum())
+    if not parts: return empty_inventory()
+    totals = pd.concat(parts, ignore_index=True).groupby(['name', 'l'], sort=False, as_index=False)['q'].sum()
+    totals = totals[totals['q'] > 0]
+    pkg, names = pd.factorize(totals['name'])
+    return make_inventory(totals['l'].to_numpy(), totals['q'].to_numpy(), pkg, [f"{file_id}_{n}" for n in names],
+                          [f"Paket {n}" for n in names])
+
+def _paket_col(header):
+    # Letar efter en kolumn för urval. Vi använder första kolumnen om 'Paket' inte hittas.
+    return list(header).index('Paket') if 'Paket' in header else 0
+
+def read_package_totals(file, progress=None):
+    """{paket: {mm: antal}} ur en packlista där varje kolumnrubrik med ett tal är en längd
+    och paketet står i kolumnen 'Paket' (annars första kolumnen)."""
+    per_paket = {}; lengths = None
+    for chunk in iter_chunks(file, progress=progress, text_col=_paket_col):
+        if lengths is None:
+            col_idx = _paket_col(chunk.columns)
+            # Identifiera längder (t.ex. 3.6, 4.2) en gång per kolumn
+            lengths = []
+            for i, col in enumerate(chunk.columns):
+                col_clean = str(col).replace(',', '.')
+                # Letar efter siffror/decimaler i kolumnnamnet
+                match = re.findall(r'\d+\.\d+|\d+', col_clean)
+                if match:
+                    val = float(match[0])
+                    # Omvandla meter till mm (t.ex. 4.2 -> 4200)
+                    lengths.append((i, int(val * 1000) if val < 100 else int(val)))
+        paket = chunk.iloc[:, col_idx].astype(object).fillna('nan').astype(str)
+        for p in paket.unique(): per_paket.setdefault(p, {})
+        for i, mm_val in lengths:
+            sums = pd.to_numeric(chunk.iloc[:, i], errors='coerce').groupby(paket.to_numpy(), sort=False).sum()
+            for p, v in sums.items():
+                per_paket[p][mm_val] = per_paket[p].get(mm_val, 0) + v
+    return per_paket
@@ -0,0 +1,100 @@
+import bisect
+import heapq
+
+# --- PACKNINGSMOTOR ---
+def _fits(rest, bit, kerf):
+    # Hur många bitar som ryms i restlängden (varje bit tar bit + kerf, sista sågsnittet får hänga över)
+    if rest < bit: return 0
+    step = bit + kerf
+    return float('inf') if step <= 0 else (rest - bit) // step + 1
+
+def pack_pieces(behov, raw_len, kerf, best_fit=False):
+    """First/Best Fit Decreasing på antal per längd ({mm: antal}). Returnerar plankorna som listor av bitar.
+
+    First fit hittar första plankan med tillräcklig restlängd i ett max-träd över plankorna,
+    best fit den minsta tillräckliga restlängden med bisect i en sorterad lista av restlängder.
+    Lika långa bitar läggs i klump: en planka fylls med så många som ryms innan nästa söks.
+    """
+    return _pack(behov, lambda bit: raw_len, kerf, best_fit)[0]
+
+def stock_pool(stock):
+    """Ett ändligt lager {längd: antal} som funktion för _pack: varje ny planka tas av den kortaste
+    längden i lager som rymmer biten (minst råvara per planka), eller None när ingen finns kvar.
+    Längderna i lager hålls sorterade och söks med bisect; en längd tas bort när den tar slut.
+    Returnerar (funktionen, {längd: förbrukat antal})."""
+    left = {int(l): int(n) for l, n in stock.items() if int(n) > 0}
+    lengths = sorted(left); used = {}
+
+    def new_plank(bit):
+        k = bisect.bisect_left(lengths, bit)
+        if k == len(lengths): return None
+        l = lengths[k]; left[l] -= 1; used[l] = used.get(l, 0) + 1
+        if not left[l]: lengths.pop(k)
+        return l
+    return new_plank, used
+
+def pack_stock(behov, stock, kerf, best_fit=False):
+    """Som pack_pieces, men plankorna tas ur ett ändligt lager med flera längder ({längd: antal}).
+    Returnerar en dict med plankorna, varje plankas längd ('langder'), förbrukat per längd
+    ('forbrukat'), kvar per längd ('kvar') och bitarna som inte fick plats ('ej_packat', {mm: antal})."""
+    new_plank, used = stock_pool(stock)
+    plankor, langder, ej_packat = _pack(behov, new_plank, kerf, best_fit)
+    kvar = {int(l): int(n) - used.get(int(l), 0) for l, n in stock.items() if int(n) > 0}
+    return {'plankor': plankor, 'langder': langder, 'forbrukat': used, 'kvar': kvar, 'ej_packat': ej_packat}
+
+def _pack(behov, new_plank, kerf, best_fit):
+    # new_plank(bit) ger längden på nästa nya planka, eller None när ingen planka finns för biten.
+    # Returnerar (plankor, längd per planka, {mm: antal bitar som inte packades})
+    plankor, langder, rest, ej_packat = [], [], [], {}
+    # First fit: segmentträd (max) över plankornas restlängder
+    size, tree = 1, [float('-inf')] * 2
+    # Best fit: sorterade unika restlängder och för varje restlängd en heap av plankindex
+    values, levels = [], {}
+
+    def put(i):
+        nonlocal size, tree
+        if best_fit:
+            r = rest[i]
+            if r not in levels:
+                bisect.insort(values, r); levels[r] = []
+            heapq.heappush(levels[r], i)
+        elif i >= size:
+            while i >= size: size *= 2
+            tree = [float('-inf')] * size + rest + [float('-inf')] * (size - len(rest))
+            for j in range(size - 1, 0, -1): tree[j] = max(tree[2 * j], tree[2 * j + 1])
+        else:
+            j = i + size; tree[j] = rest[i]; j //= 2
+            while j:
+                tree[j] = max(tree[2 * j], tree[2 * j + 1]); j //= 2
+
+    def take(bit):
+        # Plankan som nästa bit ska läggas i, eller None om ingen öppen planka rymmer den
+        if best_fit:
+            k = bisect.bisect_left(values, bit)
+            if k == len(values): return None
+            r = values[k]; i = heapq.heappop(levels[r])
+            if not levels[r]: del levels[r]; values.pop(k)
+            return i
+        if tree[1] < bit: return None
+        j = 1
+        while j < size: j = 2 * j if tree[2 * j] >= bit else 2 * j + 1
+        return j - size
+
+    for bit, antal in sorted(behov.items(), reverse=True):
+        left = int(antal)
+        while left > 0:
+            i = take(bit)
+            if i is None:
+                # Ingen öppen planka räcker: öppna nya plankor och fyll dem direkt
+                while left > 0:
+                    raw_len = new_plank(bit)
+                    if raw_len is None:
+                        ej_packat[bit] = left; left = 0; break
+                    n = int(min(left, 1 + _fits(raw_len - bit - kerf, bit, kerf)))
+                    plankor.append([bit] * n); langder.append(raw_len); rest.append(raw_len - n * (bit + kerf))
+                    put(len(plankor) - 1); left -= n
+            else:
+                n = int(min(left, _fits(rest[i], bit, kerf)))
+                plankor[i].extend([bit] * n); rest[i] -= n * (bit + kerf)
+                put(i); left -= n
+    return plankor, langder, ej_packat
@@ -0,0 +1,101 @@
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from .cache import add_counts
+from .lager import inventory_from_classes, stock_classes, take, total_boards
+from .planering import plan_inventory, merge_plans
+
+# --- PARALLELL KÖRNING ---
+# Lagret delas i skärvor som planeras i var sin process och slås sedan ihop i
+# skärvornas ordning, så samma indata ger alltid samma plan.
+#   Poststyrd:  hela paket per skärva
+#   Längdstyrd: hela råvarulängder per skärva
+#   Målstyrd/Brädstyrd: en proportionell andel av varje längdklass per skärva
+# Procentmålen kopplar ihop skärvorna. I stället för att dela räknarna får varje
+# skärva målen som en egen kvot: den styr sin egen andel mot samma procent. Med
+# mål delas paket/längder ut i tur och ordning så att skärvorna får
+# samma blandning av lager, och varje skärva måste ha minst MIN_ITEMS poster att
+# balansera med (annars färre skärvor, i värsta fall seriellt).
+
+MIN_ITEMS = 8
+
+def default_workers():
+    return max(1, min(16, os.cpu_count() or 1))
+
+def split_even(q, n):
+    # Index för n sammanhängande delar med så jämn storlek (antal brädor) som möjligt
+    total = int(q.sum())
+    shards, cur, acc = [], [], 0
+    for i, qi in enumerate(q.tolist()):
+        cur.append(i); acc += qi
+        if acc >= total * (len(shards) + 1) / n and len(shards) < n - 1:
+            shards.append(cur); cur = []
+    if cur: shards.append(cur)
+    return shards
+
+def split_round_robin(q, n):
+    idx = np.arange(len(q)); n = min(n, len(q) // MIN_ITEMS)
+    return [idx[k::n] for k in range(n)] if n > 1 else [idx]
+
+def split_classes(inv, n):
+    # Varje skärva får ungefär 1/n av varje längdklass
+    shards = [{} for _ in range(n)]
+    for l, q in stock_classes(inv).items():
+        base, rest = divmod(q, n)
+        for k in range(n):
+            if base + (k < rest): shards[k][l] = base + (k < rest)
+    return [inventory_from_classes(s) for s in shards if s]
+
+def make_shards(inv, mode, n, goals):
+    inv = take(inv, inv['q'] > 0)
+    split = split_round_robin if goals else split_even
+    if mode == "poststyrd":
+        return [take(inv, idx) for idx in split(inv['q'], n)]
+    if mode == "langdstyrd":
+        classes = list(stock_classes(inv).items())
+        return [inventory_from_classes(dict(classes[i] for i in idx)) for idx in split(np.array([q for l, q in classes]), n)]
+    return split_classes(inv, n)
+
+def _plan_shard(args):
+    inv, target_lengths, mode, opts = args
+    return plan_inventory(inv, target_lengths, mode, **opts)
+
+def plan_parallel(inv, target_lengths, mode="malstyrd", workers=None, use_extra=True, extra_l=1000, kerf=4, trim=20,
+                  max_nodes=0, time_limit=0, use_cache=True, progress=None, cancel=None):
+    """Som plan_inventory men fördelat på workers processer. Den globala strategin
+    och körningar som inte går att dela körs seriellt. Planen får också 'workers'
+    (antal skärvor som faktiskt kördes) och 'sekunder' (väggklocka). Parallellt
+    rapporteras progress per färdig skärva, och cancel ger de skärvor som hann bli klara."""
+    start = time.perf_counter()
+    opts = dict(use_extra=use_extra, extra_l=extra_l, kerf=kerf, trim=trim, max_nodes=max_nodes, time_limit=time_limit,
+                use_cache=use_cache)
+    workers = workers or default_workers()
+    shards = make_shards(inv, mode, workers, sum(target_lengths.values()) > 0) if mode != "global" and workers > 1 else []
+    if len(shards) < 2:
+        plan = plan_inventory(inv, target_lengths, mode, **opts, progress=progress, cancel=cancel); plan['workers'] = 1
+    else:
+        # Skärvorna stämmer av målen lika tätt (i brädor) som en seriell körning
+        opts['grain'] = max(1, int(inv['q'][inv['q'] > 0].sum()) // 256)
+        # spawn, inte fork: jobben körs i trådar i Streamlit-servern, och en fork medan en annan
+        # tråd håller ett lås (t.ex. mönstercachens) ger barnprocessen ett lås som aldrig släpps
+        pool = ProcessPoolExecutor(max_workers=len(shards), mp_context=multiprocessing.get_context("spawn"))
+        plans = [None] * len(shards); total_q = sum(total_boards(s) for s in shards); done = 0
+        try:
+            futures = {pool.submit(_plan_shard, (s, dict(target_lengths), mode, opts)): k for k, s in enumerate(shards)}
+            for f in as_completed(futures):
+                k = futures[f]; plans[k] = f.result(); done += total_boards(shards[k])
+                if progress: progress(done, total_q, lambda: merge_plans([p for p in plans if p]))
+                if cancel and cancel.is_set(): break
+        finally:
+            # Även när en skärva kastar ett fel stängs poolen så att inga processer blir kvar.
+            # Vid avbrott körs redan startade skärvor klart i bakgrunden men räknas inte med
+            pool.shutdown(wait=not (cancel and cancel.is_set()), cancel_futures=True)
+        plan = merge_plans([p for p in plans if p]); plan['workers'] = len(shards)
+        if None in plans: plan['cancelled'] = True
+        add_counts(plan['search_stats'].get('cache_hits', 0), plan['search_stats'].get('cache_misses', 0))
+    plan['sekunder'] = time.perf_counter() - start
+    return plan
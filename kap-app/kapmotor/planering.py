@@ -0,0 +1,366 @@
+import time
+from array import array
+from collections import Counter
+
+import numpy as np
+
+from .lager import inventory_from_classes, iter_rows, row_keys, stock_classes, take
+from .monster import make_pattern_engine, get_best_pattern
+from .kolumngenerering import solve_global, lp_bound
+from .prestanda import add_time
+
+# --- STRATEGIER (v81) ---
+STRATEGIER = {
+    "malstyrd": "Målstyrd (Blanda fritt)",
+    "bradstyrd": "Brädstyrd (En längd/bräda)",
+    "poststyrd": "Poststyrd (Hela paket)",
+    "langdstyrd": "Längdstyrd (Samma råvarulängd)",
+    "global": "Globalt optimal (Kolumngenerering)",
+}
+
+def plan_items(inv, mode):
+    # Posterna som planeras var för sig: lagerrader (Poststyrd) eller längdklasser
+    if mode == "langdstyrd":
+        u, inverse = np.unique(inv['l'], return_inverse=True)
+        sums = dict(zip(u.tolist(), np.bincount(inverse.ravel(), weights=inv['q'], minlength=len(u)).astype(np.int64).tolist()))
+        return [{'l': l, 'q': sums[l]} for l in set(inv['l'].tolist())]
+    if mode == "poststyrd":
+        return list(iter_rows(inv))
+    return [{'l': l, 'q': q} for l, q in stock_classes(inv).items()]
+
+def part_key(item, mode):
+    return item['id'] if mode == "poststyrd" else item['l']
+
+# --- KAPPLANEN SOM KOLUMNER ---
+# Mönstren internas i en tabell (plan['patterns'], id = plats i listan) som
+# (råvarulängd, bitar, spill, extra bitar). Planen är två kolumner i kapordning:
+# mönster-id (pid) och antal brädor (qty). Delplanerna per paket/längdklass
+# (plan['parts']) är också kolumner: nyckel, antal brädor och var delplanens rader
+# slutar i pid/qty. Summeringarna räknas vektoriserat ur kolumnerna.
+def intern(patterns, index, pattern):
+    pid = index.get(pattern)
+    if pid is None:
+        pid = index[pattern] = len(patterns); patterns.append(pattern)
+    return pid
+
+def boards_per_pattern(patterns, pid, qty):
+    return np.rint(np.bincount(pid, weights=qty, minlength=len(patterns))).astype(np.int64)
+
+def plan_totals(patterns, pid, qty, targets):
+    """count_t, total_c, total_ra, total_nytta och extra_c för kolumnerna pid/qty."""
+    per = boards_per_pattern(patterns, pid, qty)
+    length = np.array([p[0] for p in patterns], np.int64)
+    nytta = np.array([sum(p[1]) for p in patterns], np.int64)
+    extra = np.array([p[3] for p in patterns], np.int64)
+    per_target = np.array([[p[1].count(t) for t in targets] for p in patterns], np.int64).reshape(len(patterns), len(targets))
+    count = per_target.T @ per
+    return {'count_t': dict(zip(targets, count.tolist())), 'total_c': int(count.sum()), 'total_ra': int(length @ per),
+            'total_nytta': int(nytta @ per), 'extra_c': int(extra @ per)}
+
+def part_lengths(parts):
+    # Antal rader i pid/qty per delplan
+    return np.diff(parts['end'], prepend=0)
+
+def _group_parts(pid, qty, keys, q, lens):
+    # Delplaner med samma nyckel slås ihop där nyckeln först förekommer
+    first = {}
+    group = np.array([first.setdefault(k, len(first)) for k in keys], np.int64)
+    if len(first) < len(keys):
+        order = np.argsort(group, kind='stable'); ol = lens[order]
+        rows = np.repeat((np.cumsum(lens) - lens)[order] - (np.cumsum(ol) - ol), ol) + np.arange(ol.sum())
+        pid, qty = pid[rows], qty[rows]
+        q = np.bincount(group, weights=q, minlength=len(first)).astype(np.int64)
+        lens = np.bincount(group, weights=lens, minlength=len(first)).astype(np.int64); keys = list(first)
+    return pid, qty, {'key': list(keys), 'q': np.asarray(q, np.int64), 'end': np.cumsum(lens, dtype=np.int64)}
+
+def _plan_dict(pid, qty, keys, q, lens, patterns, targets, params, grain, lp_nytta, search_stats):
+    start = time.perf_counter()
+    # Kopior: kolumnerna i plan_inventory får inte låsas av vyer medan de växer
+    pid, qty, parts = _group_parts(np.array(pid, np.intc), np.array(qty, np.int64), keys, np.array(q, np.int64), np.array(lens, np.int64))
+    total = plan_totals(patterns, pid, qty, targets)
+    spill_pct = (1 - (total['total_nytta'] / total['total_ra'])) * 100 if total['total_ra'] > 0 else 0
+    add_time(search_stats, 'sek_summering', start)
+    return {
+        **total, 'patterns': patterns, 'pid': pid, 'qty': qty, 'spill_pct': spill_pct,
+        'lp_nytta': lp_nytta, 'search_stats': search_stats, 'parts': parts, 'params': params, 'grain': grain,
+    }
+
+def _stack(plans, patterns, index):
+    # Planernas kolumner efter varandra, omnumrerade till mönstertabellen patterns
+    pid, qty, keys, q, lens = [], [], [], [], []
+    for p in plans:
+        remap = np.array([intern(patterns, index, x) for x in p['patterns']], np.intc)
+        pid.append(remap[p['pid']] if len(p['pid']) else np.zeros(0, np.intc)); qty.append(p['qty'])
+        keys += p['parts']['key']; q.append(p['parts']['q']); lens.append(part_lengths(p['parts']))
+    cat = lambda cols, dtype: np.concatenate(cols) if cols else np.zeros(0, dtype)
+    return cat(pid, np.intc), cat(qty, np.int64), keys, cat(q, np.int64), cat(lens, np.int64)
+
+def _select_parts(plan, keep):
+    # Planen med bara delplanerna där keep (en per delplan) är sann
+    lens = part_lengths(plan['parts']); rows = np.repeat(keep, lens)
+    return {'patterns': plan['patterns'], 'pid': plan['pid'][rows], 'qty': plan['qty'][rows],
+            'parts': {'key': [k for k, k_ok in zip(plan['parts']['key'], keep) if k_ok], 'q': plan['parts']['q'][keep],
+                      'end': np.cumsum(lens[keep], dtype=np.int64)}}
+
+def max_unique(mode):
+    # Högst så många olika mållängder per bräda
+    return 5 if mode in ("malstyrd", "global") else 1
+
+def plan_inventory(inv, target_lengths, mode="malstyrd", use_extra=True, extra_l=1000, kerf=4, trim=20,
+                   max_nodes=0, time_limit=0, grain=0, use_cache=True, start_counts=None, progress=None, cancel=None):
+    """Kapplan för lagret inv (se lager.py) och mållängder {mm: mål %}.
+
+    time_limit är sekunder per mönstersökning. grain är hur ofta (i brädor) målen
+    stäms av, 0 = automatiskt. use_cache slår upp mönster i mönstercachen på disk.
+    start_counts är redan kapade bitar {mm: antal} som målen ska räkna med.
+    progress(brädor klara, brädor totalt, delplan) anropas efter varje mönster; delplan()
+    ger planen hittills. cancel (threading.Event) avbryter och ger planen hittills med 'cancelled'.
+    Returnerar en dict med mönstertabellen och kolumnerna pid/qty (se ovan), summeringarna
+    som visas i appen och delplanerna per paket/längdklass (parts) för replan_inventory.
+    """
+    targets = sorted(list(target_lengths.keys()), reverse=True)
+    goal_pcts = target_lengths
+    count_t = {l: (start_counts or {}).get(l, 0) for l in targets}; total_c = sum(count_t.values())
+    # Kolumnerna växer under körningen; delplanen som kapas är alltid den sista
+    pid, qty, keys, q, lens = array('i'), array('q'), [], array('q'), array('q')
+    patterns = []; index = {}; lp_nytta = None; search_stats = {}
+
+    def cut_board(l, max_u, counts, total):
+        # Bästa mönster för en bräda givet måluppfyllelsen, inkl. extra bitar
+        p, w = get_best_pattern(l, max_u, targets, goal_pcts, counts, total, kerf, trim, max_nodes, time_limit, search_stats, use_cache, cancel)
+        p_f = list(p); n_extra = 0
+        if use_extra:
+            t = time.perf_counter()
+            while w >= (extra_l + kerf): p_f.append(extra_l); w -= (extra_l + kerf); n_extra += 1
+            add_time(search_stats, 'sek_extra', t)
+        return p_f, w, n_extra
+
+    def after_boards(p_f, k):
+        # Måluppfyllelsen om ytterligare k brädor kapas enligt p_f
+        c = dict(count_t); n = 0
+        for b in p_f:
+            if b in c: c[b] += k; n += k
+        return c, total_c + n
+
+    def same_pattern_run(l, max_u, p_f, limit, grain):
+        # Hur många brädor i rad (max limit) som får samma mönster. Galoppera och
+        # halvera i steg om grain brädor i stället för att söka om varje bräda.
+        good, step = 0, grain
+        same = lambda k: cut_board(l, max_u, *after_boards(p_f, k))[0] == p_f
+        while good + step < limit and same(good + step):
+            good += step; step *= 2
+        bad = min(good + step, limit)
+        while bad - good > grain:
+            mid = good + max(grain, (bad - good) // (2 * grain) * grain)
+            if same(mid): good = mid
+            else: bad = mid
+        return min(good + grain, limit)
+
+    def book(l, bits, w, n, n_extra):
+        # Bokför n brädor med samma mönster i den sista delplanen och i målräknarna
+        nonlocal total_c
+        for b in bits:
+            if b in count_t: count_t[b] += n; total_c += n
+        pid.append(intern(patterns, index, (l, bits, w, n_extra))); qty.append(n); lens[-1] += 1
+
+    # Kör logiken baserat på valt läge
+    split_classes = mode in ("malstyrd", "bradstyrd")
+    if mode == "global":
+        t = time.perf_counter()
+        plan = solve_global(stock_classes(inv), targets, goal_pcts, kerf, trim, max_unique(mode), extra_l if use_extra else None)[0]
+        add_time(search_stats, 'sek_lp', t)
+        keys.append(None); q.append(sum(n for l, bits, w, n, n_extra in plan)); lens.append(0)
+        for l, bits, w, n, n_extra in plan: book(l, bits, w, n, n_extra)
+        items = []
+    else: # Målstyrd/Brädstyrd - längdklasser som delas upp på flera mönster när målen kräver det
+        items = plan_items(inv, mode)
+    # Målen stäms av minst var grain:e bräda (högst ~256 avstämningar per körning)
+    total_q = sum(i['q'] for i in items if i['q'] > 0)
+    grain = grain or max(1, total_q // 256)
+    params = plan_params(target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit)
+    snapshot = lambda: _plan_dict(pid, qty, list(keys), q, lens, list(patterns), targets, params, grain, lp_nytta, dict(search_stats))
+    done = 0; cancelled = False
+
+    for item in items:
+        if cancelled: break
+        max_u = max_unique(mode)
+        keys.append(part_key(item, mode)); q.append(item['q']); lens.append(0)
+        left = item['q']
+        while left > 0:
+            p_f, w, n_extra = cut_board(item['l'], max_u, count_t, total_c)
+            n = same_pattern_run(item['l'], max_u, p_f, left, grain) if split_classes else left
+            book(item['l'], tuple(sorted(p_f)), w, n, n_extra)
+            left -= n; done += n
+            if progress: progress(done, total_q, snapshot)
+            if cancel and cancel.is_set():
+                # Planen hittills: delplanen räknas bara med det som hann kapas
+                q[-1] -= left; cancelled = True; break
+
+    if not cancelled:
+        # Undre gräns för spillet (LP utan procentmål), i alla lägen så att planen kan jämföras med optimum
+        t = time.perf_counter()
+        lp_nytta = lp_bound(stock_classes(inv), targets, kerf, trim, max_unique(mode), extra_l if use_extra else None)
+        add_time(search_stats, 'sek_lp', t)
+    plan = _plan_dict(pid, qty, keys, q, lens, patterns, targets, params, grain, lp_nytta, search_stats)
+    if cancelled: plan['cancelled'] = True
+    return plan
+
+def plan_params(target_lengths, mode="malstyrd", use_extra=True, extra_l=1000, kerf=4, trim=20, max_nodes=0, time_limit=0):
+    # Allt utom lagret som planen beror på; sparas i planen som plan['params']
+    return (mode, tuple(sorted(target_lengths.items())), use_extra, extra_l, kerf, trim, max_nodes, time_limit)
+
+def can_replan(prev, target_lengths, mode="malstyrd", use_extra=True, extra_l=1000, kerf=4, trim=20, max_nodes=0, time_limit=0):
+    """True när replan_inventory kan uppdatera prev stegvis, dvs. bara lagret har ändrats och
+    strategin inte är global. Annars blir det en hel ny plan, som appen kör som bakgrundsjobb."""
+    return (prev is not None and mode != "global"
+            and prev.get('params') == plan_params(target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit))
+
+def replan_inventory(prev, inv, target_lengths, mode="malstyrd", use_extra=True, extra_l=1000, kerf=4, trim=20,
+                     max_nodes=0, time_limit=0, use_cache=True):
+    """Uppdatera planen prev efter ändringar i lagret. Bara paket/längdklasser vars antal
+    ändrats planeras om, med målräknarna från resten av planen som utgångsläge; resten
+    behåller sina mönster. Ändrade mål, inställningar eller strategi, och den globala
+    strategin, ger en ny hel plan. plan['replanned'] är antalet omplanerade poster."""
+    params = plan_params(target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit)
+    if not can_replan(prev, target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit):
+        plan = plan_inventory(inv, target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit, use_cache=use_cache)
+        plan['replanned'] = len(plan['parts']['key'])
+        return plan
+    targets = sorted(list(target_lengths.keys()), reverse=True)
+    items, q = {}, {}
+    for item in plan_items(inv, mode):
+        k = part_key(item, mode); items.setdefault(k, []).append(item); q[k] = q.get(k, 0) + item['q']
+    prev_q = dict(zip(prev['parts']['key'], prev['parts']['q'].tolist()))
+    changed = [k for k in items if k not in prev_q or prev_q[k] != q[k]]
+    changed_set = set(changed)
+    keep = np.array([k in items and k not in changed_set for k in prev['parts']['key']], bool)
+    if keep.all() and not changed:
+        return {**prev, 'replanned': 0, 'search_stats': {}}
+    kept = _select_parts(prev, keep)
+    base = plan_totals(prev['patterns'], kept['pid'], kept['qty'], targets)
+    if mode == "poststyrd": sub_inv = take(inv, np.isin(np.array(row_keys(inv), object), changed))
+    else: sub_inv = inventory_from_classes({i['l']: i['q'] for k in changed for i in items[k]})
+    sub = plan_inventory(sub_inv, target_lengths, mode, use_extra, extra_l, kerf, trim, max_nodes, time_limit, prev['grain'], use_cache, base['count_t'])
+    patterns = list(prev['patterns']); index = {p: i for i, p in enumerate(patterns)}
+    lp_nytta = lp_bound(stock_classes(inv), targets, kerf, trim, max_unique(mode), extra_l if use_extra else None)
+    plan = _plan_dict(*_stack([kept, sub], patterns, index), patterns, targets, params, prev['grain'], lp_nytta, sub['search_stats'])
+    plan['replanned'] = len(changed)
+    return plan
+
+def merge_plans(plans):
+    # Slå ihop planer för olika delar av lagret (t.ex. parallella skärvor) i ordning.
+    # En längdklass som finns i flera planer blir en delplan.
+    patterns = []; index = {}
+    search_stats = {}
+    for p in plans:
+        for k, v in p['search_stats'].items(): search_stats[k] = search_stats.get(k, 0) + v
+    first = plans[0]
+    targets = sorted(first['count_t'], reverse=True)
+    # Gränsen är en summa per råvarulängd, så skärvornas gränser kan läggas ihop
+    lp_nytta = sum(p['lp_nytta'] for p in plans) if all(p['lp_nytta'] is not None for p in plans) else None
+    return _plan_dict(*_stack(plans, patterns, index), patterns, targets, first['params'], first['grain'], lp_nytta, search_stats)
+
+def summarize(plan):
+    """Antal brädor per mönster {(råvarulängd, bitar, spill): antal} i kapordning."""
+    per = boards_per_pattern(plan['patterns'], plan['pid'], plan['qty'])
+    first = np.unique(plan['pid'], return_index=True)[1] if len(plan['pid']) else []
+    order = plan['pid'][np.sort(first)].tolist() if len(first) else []
+    final_summary = Counter()
+    for i in order:
+        rl, bits, w, n_extra = plan['patterns'][i]
+        final_summary[(rl, bits, w)] += int(per[i])
+    return final_summary
+
+def format_line(rl, bits, w, qty):
+    row_spill = (w / rl) * 100
+    return f"{qty} st á {rl} mm --> {list(bits)} (Spill: {int(w)} mm / {row_spill:.1f}%)"
+
+def cut_list_lines(plan):
+    for (rl, bits, w), qty in summarize(plan).items():
+        yield format_line(rl, bits, w, qty)
+
+def iter_export_text(plan):
+    # Kaplistan som text, rad för rad
+    yield f"KAPLISTA v81.0\nSPILL: {plan['spill_pct']:.2f}%\n" + "="*50 + "\n"
+    for line in cut_list_lines(plan): yield line + "\n"
+
+def export_text(plan):
+    return "".join(iter_export_text(plan))
+
+# --- LAGERPLANERING (v44) ---
+def plan_stock(storage, target_lengths, kerf=4, max_unique=2, use_pct_logic=False, use_extra=True, extra_len=1000,
+               trim_front=10, trim_back=10, use_cache=True, progress=None, cancel=None):
+    """Kapplan för lager {längd: antal} enligt v44: minsta spill per bräda, med
+    procentmålen som prioritetsordning mellan lika bra mönster. progress och cancel
+    fungerar som i plan_inventory."""
+    # Lagret hanteras som längdklasser (längd, antal) i stället för en post per bräda
+    lager_klasser = sorted(((l, q) for l, q in storage.items() if q > 0), reverse=True)
+    instruktioner = Counter()
+    targets = sorted(list(target_lengths.keys()), reverse=True)
+    goal_pcts = target_lengths
+    count_tracker = {l: 0 for l in targets}
+    total_cut_pieces = 0
+    extra_tracker = 0
+    stats = {}
+
+    best_pattern = make_pattern_engine(kerf, max_unique, use_cache, stats)
+    total_q = sum(q for l, q in lager_klasser); done = 0; cancelled = False
+
+    def result():
+        return {
+            'instruktioner': Counter(instruktioner), 'targets': targets, 'count_tracker': dict(count_tracker),
+            'total_cut_pieces': total_cut_pieces, 'extra_tracker': extra_tracker, 'search_stats': dict(stats),
+        }
+
+    def priority_order(pattern=(), k=0):
+        # Prioritetsordningen efter ytterligare k brädor med samma mönster
+        if not (use_pct_logic and sum(goal_pcts.values()) > 0):
+            return tuple(targets)
+        per_board = Counter(pattern)
+        total = total_cut_pieces + k * len(pattern)
+        return tuple(sorted(targets, key=lambda x: ((count_tracker[x] + k * per_board[x]) / max(1, total)) - (goal_pcts[x]/100)))
+
+    def same_order_run(order, pattern, limit):
+        # Antal brädor i rad (max limit) som får samma ordning och därmed samma mönster.
+        # Varje par av mål byter plats högst en gång när k växer, så det räcker att
+        # galoppera och sedan halvera intervallet.
+        if not (use_pct_logic and sum(goal_pcts.values()) > 0):
+            return limit
+        good, step = 0, 1
+        while good + step < limit and priority_order(pattern, good + step) == order:
+            good += step; step *= 2
+        bad = min(good + step, limit)
+        while bad - good > 1:
+            mid = (good + bad) // 2
+            if priority_order(pattern, mid) == order: good = mid
+            else: bad = mid
+        return good + 1
+
+    for ra_len, kvar in lager_klasser:
+        available = ra_len - trim_front - trim_back
+        while kvar > 0 and not cancelled:
+            t = time.perf_counter()
+            order = priority_order()
+            t = add_time(stats, 'sek_poang', t)
+            pattern, waste_after = best_pattern(available, order)
+            t = time.perf_counter()
+            antal = same_order_run(order, pattern, kvar)
+            add_time(stats, 'sek_poang', t)
+            for b in pattern:
+                count_tracker[b] += antal
+                total_cut_pieces += antal
+            if use_extra:
+                t = time.perf_counter()
+                while waste_after >= (extra_len + kerf):
+                    pattern.append(extra_len); waste_after -= (extra_len + kerf); extra_tracker += antal
+                if not pattern and waste_after >= extra_len:
+                     pattern.append(extra_len); waste_after -= extra_len; extra_tracker += antal
+                add_time(stats, 'sek_extra', t)
+            instruktioner[(ra_len, tuple(sorted(pattern)))] += antal
+            kvar -= antal; done += antal
+            if progress: progress(done, total_q, result)
+            cancelled = bool(cancel and cancel.is_set())
+
+    plan = result()
+    if cancelled: plan['cancelled'] = True
+    return plan
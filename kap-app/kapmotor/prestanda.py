@@ -0,0 +1,83 @@
+import cProfile
+import io
+import json
+import marshal
+import pstats
+import time
+
+# --- PRESTANDA ---
+# Motorerna lägger räknare och tider i planens search_stats: räknarna som tidigare
+# (searches, nodes, pruned, cutoffs, cache_hits, cache_misses, ...) och sekunder per
+# fas under nycklar som börjar med "sek_". Allt är summor, så skärvor och omplaneringar
+# slås ihop genom att lägga ihop nycklarna (se merge_plans). Faserna mäts per
+# mönstersökning och per bokföring, inte per nod, så mätningen är alltid på.
+
+FASER = {
+    'sek_import': "Inläsning av packlista",
+    'sek_poang': "Poängsättning och sortering av mållängder",
+    'sek_backtrack': "Mönstersökning (backtrack)",
+    'sek_dp': "Mönstersökning (DP-tabeller)",
+    'sek_lp': "Kolumngenerering (LP)",
+    'sek_cache': "Mönstercache på disk",
+    'sek_extra': "Extra bitar",
+    'sek_summering': "Summering av planen",
+    'sek_rendering': "Visning av kaplistan",
+}
+
+def add_time(stats, key, start):
+    # Lägg tiden sedan start (perf_counter) till fasen key och returnera nu, starten för nästa fas
+    now = time.perf_counter()
+    stats[key] = stats.get(key, 0.0) + now - start
+    return now
+
+def count(stats, key, n=1):
+    stats[key] = stats.get(key, 0) + n
+
+def _pct(a, b):
+    return round(100 * a / b, 2) if b else None
+
+def performance_report(stats, total_s=None):
+    """Faser (sekunder och andel), räknare och kvoter ur search_stats, för Prestanda-panelen
+    och JSON-exporten. Med total_s (väggklocka för körningen) visas också tid utanför faserna."""
+    faser = {k: v for k, v in stats.items() if k.startswith('sek_')}
+    raknare = {k: v for k, v in stats.items() if not k.startswith('sek_')}
+    total = total_s if total_s else sum(faser.values())
+    rows = [{'fas': k, 'namn': FASER.get(k, k), 'sekunder': round(v, 4), 'andel_pct': _pct(v, total)}
+            for k, v in sorted(faser.items(), key=lambda kv: -kv[1])]
+    if total_s and total_s > sum(faser.values()):
+        rest = total_s - sum(faser.values())
+        rows.append({'fas': 'ovrigt', 'namn': "Övrigt", 'sekunder': round(rest, 4), 'andel_pct': _pct(rest, total)})
+    hits, misses = raknare.get('cache_hits', 0), raknare.get('cache_misses', 0)
+    searches = raknare.get('searches', 0)
+    kvoter = {
+        'cache_traff_pct': _pct(hits, hits + misses),
+        'minne_traff_pct': _pct(raknare['minne_traffar'], searches) if 'minne_traffar' in raknare else None,
+        'avskurna_pct': _pct(raknare.get('pruned', 0), raknare.get('nodes', 0)),
+        'noder_per_sokning': round(raknare.get('nodes', 0) / searches, 1) if searches and 'nodes' in raknare else None,
+        'avbrutna_pct': _pct(raknare.get('cutoffs', 0), searches),
+    }
+    return {'sekunder_totalt': round(total, 4), 'faser': rows, 'raknare': raknare, 'kvoter': {k: v for k, v in kvoter.items() if v is not None}}
+
+def report_json(report, **extra):
+    return json.dumps({**extra, **report}, ensure_ascii=False, indent=2)
+
+# --- PROFILERING ---
+def profiled(fn):
+    """fn som jobbfunktion (se jobb.submit), men körd under cProfile. Profilen läggs i
+    planen som text (plan['profil']) och som pstats-data (plan['profil_data']).
+    Bara tråden som kör fn profileras, inte processerna i en parallell körning."""
+    def run(*args, **kwargs):
+        prof = cProfile.Profile()
+        plan = prof.runcall(fn, *args, **kwargs)
+        plan['profil'] = profile_text(prof); plan['profil_data'] = profile_data(prof)
+        return plan
+    return run
+
+def profile_text(prof, n=30):
+    out = io.StringIO()
+    pstats.Stats(prof, stream=out).sort_stats("cumulative").print_stats(n)
+    return out.getvalue()
+
+def profile_data(prof):
+    # Samma innehåll som pstats.Stats.dump_stats, för nedladdning (öppnas med pstats/snakeviz)
+    return marshal.dumps(pstats.Stats(prof).stats)
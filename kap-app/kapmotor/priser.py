@@ -0,0 +1,127 @@
+import re
+
+import numpy as np
+import pandas as pd
+
+from .packlista import iter_chunks
+
+# --- PRISKALKYL FÖR HELA ORDERBÖCKER ---
+# Samma kalkyl som Priskalkyl-fliken, men för alla rader i en orderbok på en gång:
+# varje steg är en kolumnoperation i NumPy/pandas. Kolumner som saknas i orderboken
+# (t.ex. råvarupris eller marginal) tas från fältens värden i fliken.
+
+# nyckel: (kolumnrubrik, andra rubriker som godtas)
+ORDER_COLUMNS = {
+    'order_m': ("Orderstorlek (lpm)", ("orderstorlek", "lopmeter", "lpm", "order")),
+    'raw_t': ("Råvara tjocklek (mm)", ("ravaratjocklek", "ravarutjocklek")),
+    'raw_b': ("Råvara bredd (mm)", ("ravarabredd", "ravarubredd")),
+    'nom_t': ("Färdig tjocklek (mm)", ("fardigtjocklek", "tjocklek")),
+    'nom_b': ("Färdig bredd (mm)", ("fardigbredd", "bredd")),
+    'raw_price_m3': ("Råvarupris (kr/m³)", ("ravarupris", "ravarapris")),
+    'split_parts': ("Klyvning (st)", ("klyvning", "antaldelar", "delar")),
+    'capacity_m3_shift': ("Kapacitet (m³/skift)", ("kapacitet",)),
+    'plane_cost_m3': ("Hyvelkostnad (kr/m³)", ("hyvelkostnad", "extrahyvelkostnad")),
+    'setup_cost': ("Ställkostnad (kr)", ("stallkostnad",)),
+    'margin_pct': ("Marginal (%)", ("marginal", "vinstmarginal")),
+}
+REQUIRED = ('order_m', 'raw_t', 'raw_b', 'nom_t', 'nom_b')
+
+QUOTE_COLUMNS = {
+    'raw_cost_lpm': "Råvarukostnad (kr/lpm)",
+    'prod_cost_lpm': "Produktionskostnad (kr/lpm)",
+    'total_cost_lpm': "Självkostnad (kr/lpm)",
+    'final_sale_lpm': "Pris (kr/lpm)",
+    'sale_m3': "Pris (kr/m³)",
+    'total_order_price': "Ordervärde (kr)",
+}
+
+def _norm(header):
+    # "Råvara Tjocklek (mm)" -> "ravaratjocklek"
+    text = str(header).lower().split("(")[0]
+    text = text.translate(str.maketrans("åäö", "aao"))
+    return re.sub(r"[^a-z]", "", text)
+
+def quote(order_m, raw_price_m3, raw_t, raw_b, nom_t, nom_b, split_parts, capacity_m3_shift, plane_cost_m3, setup_cost,
+          margin_pct, shift_cost):
+    """Priskalkylen för en order eller för hela kolumner (arrayer/Series) i ett svep.
+    Returnerar en dict med nycklarna i QUOTE_COLUMNS."""
+    cap = np.asarray(capacity_m3_shift, dtype=float)
+    shift = np.asarray(shift_cost, dtype=float)
+    calc_prod_cost_m3 = np.divide(shift, cap, out=np.zeros(np.broadcast(shift, cap).shape), where=cap > 0)
+    vol_m_raw = (np.asarray(raw_t, dtype=float) * raw_b) / 1_000_000
+    vol_m_nom = (np.asarray(nom_t, dtype=float) * nom_b) / 1_000_000
+
+    raw_cost_lpm = (vol_m_raw * raw_price_m3) / split_parts
+    prod_cost_lpm = vol_m_nom * (calc_prod_cost_m3 + plane_cost_m3)
+
+    total_cost_lpm = raw_cost_lpm + prod_cost_lpm
+    markup = 1 + (np.asarray(margin_pct, dtype=float) / 100)
+    final_sale_lpm = total_cost_lpm * markup
+    total_order_price = (final_sale_lpm * order_m) + (setup_cost * markup)
+    # 0 kr/m³ utan färdig dimension, som i fliken; tomma värden förblir tomma
+    sale_m3 = np.divide(final_sale_lpm, vol_m_nom, out=np.array(final_sale_lpm * 0.0, dtype=float), where=vol_m_nom > 0)
+    return {
+        'raw_cost_lpm': raw_cost_lpm, 'prod_cost_lpm': prod_cost_lpm, 'total_cost_lpm': total_cost_lpm,
+        'final_sale_lpm': final_sale_lpm, 'sale_m3': sale_m3, 'total_order_price': total_order_price,
+    }
+
+def read_order_book(file):
+    """Orderboken som DataFrame med en kolumn per nyckel i ORDER_COLUMNS som finns i filen
+    (talkolumner, decimalkomma tillåtet) plus övriga kolumner oförändrade, t.ex. artikel eller kund.
+    ValueError om någon av de obligatoriska kolumnerna saknas."""
+    file.seek(0)
+    if file.name.endswith('.csv'):
+        # Semikolon eller komma; allt läses som text och tolkas nedan
+        df = pd.read_csv(file, sep=None, engine='python', dtype=str)
+    else:
+        df = pd.concat(list(iter_chunks(file)), ignore_index=True)
+    aliases = {}
+    for key, (label, others) in ORDER_COLUMNS.items():
+        for name in (_norm(label),) + others: aliases.setdefault(name, key)
+    rename = {}
+    for col in df.columns:
+        key = aliases.get(_norm(col))
+        if key and key not in rename.values(): rename[col] = key
+    df = df.rename(columns=rename)
+    missing = [ORDER_COLUMNS[k][0] for k in REQUIRED if k not in df.columns]
+    if missing: raise ValueError("Orderboken saknar kolumnerna: " + ", ".join(missing))
+    for key in rename.values():
+        col = df[key]
+        if not pd.api.types.is_numeric_dtype(col): col = col.astype(str).str.replace(" ", "").str.replace(",", ".")
+        df[key] = pd.to_numeric(col, errors='coerce')
+    return df
+
+def quote_frame(orders, defaults, shift_cost):
+    """Kalkyl för varje rad i orders (från read_order_book), med kalkylens kolumner (QUOTE_COLUMNS)
+    tillagda. defaults ger värdena för de valfria kolumnerna när de saknas i orderboken eller är
+    tomma på en rad. Rader som saknar någon av de obligatoriska (REQUIRED) får tomma värden (NaN)
+    i alla kalkylens kolumner."""
+    def col(key):
+        if key not in orders: return defaults[key]
+        values = orders[key].fillna(defaults[key]) if key in defaults else orders[key]
+        return values.to_numpy(float)
+    result = quote(*(col(k) for k in ('order_m', 'raw_price_m3', 'raw_t', 'raw_b', 'nom_t', 'nom_b', 'split_parts',
+                                      'capacity_m3_shift', 'plane_cost_m3', 'setup_cost', 'margin_pct')), shift_cost)
+    # En rad utan orderstorlek eller dimension får inget pris alls, inte bara inget ordervärde
+    valid = orders[list(REQUIRED)].notna().all(axis=1).to_numpy()
+    out = orders.rename(columns={k: label for k, (label, others) in ORDER_COLUMNS.items()})
+    for key, label in QUOTE_COLUMNS.items():
+        out[label] = np.where(valid, np.broadcast_to(result[key], (len(orders),)), np.nan)
+    return out
+
+def frame_rows(df):
+    # Raderna som tupler för iter_csv/write_xlsx; tomma värden (NaN) blir tomma celler
+    return df.astype(object).where(df.notna(), None).itertuples(index=False, name=None)
+
+def sensitivity_grid(orders, defaults, margins, shift_costs):
+    """Orderbokens totala värde (kr) för varje kombination av skiftkostnad (rader) och
+    marginal (kolumner). Marginalen i grid:en ersätter orderbokens och fältets marginal.
+    Värdet är (1 + marginal) * (A + skiftkostnad * B) med A och B summerade över raderna
+    en gång, så grid:en kostar lika lite oavsett orderbokens storlek."""
+    # Värdet utan marginal är linjärt i skiftkostnaden: A vid 0 kr, A + B vid 1 kr
+    base = orders.drop(columns='margin_pct', errors='ignore'); no_margin = {**defaults, 'margin_pct': 0}
+    total = lambda shift: np.nansum(quote_frame(base, no_margin, shift)[QUOTE_COLUMNS['total_order_price']].to_numpy(float))
+    a = total(0); b = total(1) - a
+    margins = np.asarray(margins, dtype=float); shift_costs = np.asarray(shift_costs, dtype=float)
+    grid = (1 + margins[None, :] / 100) * (a + shift_costs[:, None] * b)
+    return pd.DataFrame(grid, index=pd.Index(shift_costs, name="Skiftkostnad (kr)"), columns=pd.Index(margins, name="Marginal (%)"))
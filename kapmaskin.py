@@ -1,11 +1,45 @@
+import os
+import sys
+import time
+import numpy as np
 import streamlit as st
 import pandas as pd
-import re
-from collections import Counter
-from datetime import datetime
+
+# Kapmotorn ligger i kap-app/kapmotor
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "kap-app"))
+from kapmotor import (plan_stock, cache_info, clear_cache, submit, job_status, cancel_job, forget, server_load, format_seconds,
+                      performance_report, report_json, profiled, file_digest, iter_csv, to_bytes, write_xlsx,
+                      ORDER_COLUMNS, REQUIRED, QUOTE_COLUMNS, quote, read_order_book, quote_frame, frame_rows, sensitivity_grid)
 
 st.set_page_config(page_title="Kapmaskinen Pro v44", layout="wide")
 
+def plan_spill(plan):
+    # Spill i % för en (del)plan från plan_stock
+    ra = sum(r[0] * n for r, n in plan['instruktioner'].items())
+    return (1 - sum(sum(r[1]) * n for r, n in plan['instruktioner'].items()) / ra) * 100 if ra > 0 else 0
+
+@st.fragment(run_every=1.0)
+def show_job():
+    # Jobbets förlopp uppdateras varje sekund utan att resten av sidan körs om
+    job = job_status(st.session_state.job_id)
+    if job is None or job['status'] in ("klar", "avbruten", "fel"):
+        if job and job['plan']: st.session_state.plan = job['plan']
+        st.session_state.last_job = job
+        forget(st.session_state.job_id); st.session_state.job_id = None
+        st.rerun()
+    if job['status'] == "i kö":
+        running, queued = server_load()
+        st.info(f"⏳ I kö som nummer {job['ko']} ({running} jobb kör just nu på servern)")
+    else:
+        frac = job['done'] / job['total'] if job['total'] else 0.0
+        st.progress(frac, text=f"Optimerar... {job['done']} av {job['total']} brädor ({frac:.0%})")
+        c1, c2, c3 = st.columns(3)
+        c1.metric("Brädor klara", f"{job['done']} / {job['total']}")
+        c2.metric("Spill hittills", "–" if job['spill_pct'] is None else f"{job['spill_pct']:.1f} %")
+        c3.metric("Tid kvar (uppskattad)", format_seconds(job['eta_s']))
+    if st.button("⏹️ Avbryt optimeringen", key="cancel_job"):
+        cancel_job(st.session_state.job_id)
+
 # --- INITIALISERA SESSION STATE ---
 if "manual_storage" not in st.session_state:
     st.session_state.manual_storage = {}
@@ -13,6 +47,8 @@ if "target_lengths" not in st.session_state:
     st.session_state.target_lengths = {1060: 0, 1090: 0, 1120: 0}
 if "shift_cost" not in st.session_state:
     st.session_state.shift_cost = 21000.0
+if "job_id" not in st.session_state:
+    st.session_state.job_id = None; st.session_state.last_job = None; st.session_state.plan = None
 
 # --- 1. SIDOPANEL ---
 with st.sidebar:
@@ -54,16 +90,25 @@ with st.sidebar:
     trim_front = st.number_input("FRAM (mm)", value=10)
     trim_back = st.number_input("BAK (mm)", value=10)
 
+    st.divider()
+    st.header("🗄️ Mönstercache")
+    use_cache = st.checkbox("Spara mönster på disk", value=True)
+    info = cache_info()
+    if info['active']: st.caption(f"{info['rows']} av max {info['max_rows']} mönster sparade · {info['hits']} träffar / {info['misses']} missar sedan start")
+    else: st.caption("Avstängd (ingen skrivbar cachefil)")
+    if st.button("Töm mönstercache"):
+        clear_cache(); st.rerun()
+
+    st.divider()
+    st.header("⏱️ Prestanda")
+    profile_run = st.checkbox("Profilera nästa körning (cProfile)", value=False)
+
 # --- 2. HUVUDYTA ---
 tab1, tab2 = st.tabs(["✂️ Optimering", "💰 Priskalkyl"])
 
 # --- FLIK 1: OPTIMERING ---
 with tab1:
     st.title("✂️ Kapmaskin v44")
-    
-    lager_plankor = []
-    for l, q in st.session_state.manual_storage.items():
-        lager_plankor.extend([l] * q)
 
     st.header("🎯 1. Mållängder & Strategi")
     use_pct_logic = st.toggle("Aktivera Procentstyrning", value=False)
@@ -83,74 +128,70 @@ with tab1:
                 del st.session_state.target_lengths[l]
                 st.rerun()
 
-    if st.button("🚀 KÖR OPTIMERING", type="primary", use_container_width=True):
-        if not lager_plankor:
+    if st.button("🚀 KÖR OPTIMERING", type="primary", use_container_width=True, disabled=st.session_state.job_id is not None):
+        if not any(q > 0 for q in st.session_state.manual_storage.values()):
             st.error("Lagret är tomt!")
         else:
-            lager_plankor.sort(reverse=True)
-            resultat_raw = []
-            targets = sorted(list(st.session_state.target_lengths.keys()), reverse=True)
-            goal_pcts = st.session_state.target_lengths
-            count_tracker = {l: 0 for l in targets}
-            total_cut_pieces = 0
-            extra_tracker = 0
-
-            def get_best_combination(rem_len, current_pattern):
-                best_pattern = list(current_pattern)
-                min_waste = rem_len
-                unique_in_pattern = set(current_pattern)
-                
-                if use_pct_logic and sum(goal_pcts.values()) > 0:
-                    sorted_targets = sorted(targets, key=lambda x: (count_tracker[x] / max(1, total_cut_pieces)) - (goal_pcts[x]/100))
-                else:
-                    sorted_targets = targets
-
-                for t in sorted_targets:
-                    if len(unique_in_pattern | {t}) > max_unique: continue
-                    needed = t + (kerf if current_pattern else 0)
-                    if needed <= rem_len:
-                        res_pattern, res_waste = get_best_combination(rem_len - needed, current_pattern + [t])
-                        if res_waste < min_waste:
-                            min_waste = res_waste
-                            best_pattern = res_pattern
-                        if min_waste == 0: break
-                return best_pattern, min_waste
-
-            for ra_len in lager_plankor:
-                available = ra_len - trim_front - trim_back
-                pattern, waste_after = get_best_combination(available, [])
-                for b in pattern:
-                    count_tracker[b] += 1
-                    total_cut_pieces += 1
-                if use_extra:
-                    while waste_after >= (extra_len + kerf):
-                        pattern.append(extra_len); waste_after -= (extra_len + kerf); extra_tracker += 1
-                    if not pattern and waste_after >= extra_len:
-                         pattern.append(extra_len); waste_after -= extra_len; extra_tracker += 1
-                resultat_raw.append((ra_len, tuple(sorted(pattern))))
-
-            st.divider()
-            total_ra_m = sum([r[0] for r in resultat_raw]) / 1000
-            total_nytta_m = sum([sum(r[1]) for r in resultat_raw]) / 1000
-            utnyttjande = (total_nytta_m / total_ra_m * 100) if total_ra_m > 0 else 0
-            
-            m1, m2, m3, m4 = st.columns(4)
-            m1.metric("Råvara", f"{total_ra_m:.1f} m")
-            m2.metric("Utnyttjande", f"{utnyttjande:.1f} %")
-            m3.metric("Spill", f"{100 - utnyttjande:.1f} %")
-            m4.metric("Nyttigt spill", f"{extra_tracker} st")
-
-            stat_df = []
-            for l in targets:
-                v_p = (count_tracker[l] / max(1, total_cut_pieces) * 100) if total_cut_pieces > 0 else 0
-                stat_df.append({"Längd": l, "Antal": count_tracker[l], "Verklig %": f"{v_p:.1f}%"})
-            st.table(pd.DataFrame(stat_df))
-
-            st.header("🪵 Kaplista")
-            instruktioner = Counter(resultat_raw)
-            for (ra_l, bitar), antal in sorted(instruktioner.items(), key=lambda x: x[0][0], reverse=True):
-                with st.expander(f"📦 {antal} st á {ra_l} mm -> {list(bitar)}"):
-                    st.write(f"Mönster: {' + '.join(map(str, bitar))}")
+            # Optimeringen körs i bakgrunden; sidan visar förloppet tills jobbet är klart
+            st.session_state.job_id = submit(profiled(plan_stock) if profile_run else plan_stock, dict(st.session_state.manual_storage), dict(st.session_state.target_lengths),
+                                             kerf, max_unique, use_pct_logic, use_extra, extra_len, trim_front, trim_back, use_cache,
+                                             spill_of=plan_spill)
+            st.session_state.plan = None; st.session_state.last_job = None
+
+    if st.session_state.job_id is not None:
+        show_job()
+
+    last_job = st.session_state.last_job
+    if last_job and last_job['status'] == "fel":
+        st.error(f"Optimeringen misslyckades: {last_job['fel']}")
+    plan = st.session_state.plan
+    if plan and st.session_state.job_id is None:
+        instruktioner, targets = plan['instruktioner'], plan['targets']
+        count_tracker, total_cut_pieces, extra_tracker = plan['count_tracker'], plan['total_cut_pieces'], plan['extra_tracker']
+
+        st.divider()
+        if plan.get('cancelled'):
+            st.warning(f"Optimeringen avbröts. Kaplistan nedan gäller de {sum(instruktioner.values())} brädor som hann optimeras.")
+        total_ra_m = sum(r[0] * n for r, n in instruktioner.items()) / 1000
+        total_nytta_m = sum(sum(r[1]) * n for r, n in instruktioner.items()) / 1000
+        utnyttjande = (total_nytta_m / total_ra_m * 100) if total_ra_m > 0 else 0
+        
+        m1, m2, m3, m4 = st.columns(4)
+        m1.metric("Råvara", f"{total_ra_m:.1f} m")
+        m2.metric("Utnyttjande", f"{utnyttjande:.1f} %")
+        m3.metric("Spill", f"{100 - utnyttjande:.1f} %")
+        m4.metric("Nyttigt spill", f"{extra_tracker} st")
+
+        stat_df = []
+        for l in targets:
+            v_p = (count_tracker[l] / max(1, total_cut_pieces) * 100) if total_cut_pieces > 0 else 0
+            stat_df.append({"Längd": l, "Antal": count_tracker[l], "Verklig %": f"{v_p:.1f}%"})
+        st.table(pd.DataFrame(stat_df))
+
+        st.header("🪵 Kaplista")
+        render_start = time.perf_counter()
+        for (ra_l, bitar), antal in sorted(instruktioner.items(), key=lambda x: x[0][0], reverse=True):
+            with st.expander(f"📦 {antal} st á {ra_l} mm -> {list(bitar)}"):
+                st.write(f"Mönster: {' + '.join(map(str, bitar))}")
+        render_s = time.perf_counter() - render_start
+
+        with st.expander("⏱️ Prestanda"):
+            search_stats = plan.get('search_stats', {})
+            job_s = last_job['klar'] - last_job['startad'] if last_job and last_job['startad'] and last_job['klar'] else None
+            report = performance_report({**search_stats, 'sek_rendering': render_s}, job_s + render_s if job_s else None)
+            kvoter = report['kvoter']
+            p1, p2, p3 = st.columns(3)
+            p1.metric("Mönsteruppslag", search_stats.get('searches', 0))
+            p2.metric("Träffar i minnet", f"{kvoter['minne_traff_pct']:.1f} %" if 'minne_traff_pct' in kvoter else "–")
+            p3.metric("Cacheträffar på disk", f"{kvoter['cache_traff_pct']:.1f} %" if 'cache_traff_pct' in kvoter else "–")
+            st.dataframe(pd.DataFrame(report['faser'], columns=['namn', 'sekunder', 'andel_pct']).rename(
+                columns={'namn': "Fas", 'sekunder': "Sekunder", 'andel_pct': "Andel %"}), hide_index=True, use_container_width=True)
+            st.download_button("📥 Exportera mätningen (JSON)", report_json(report, max_unique=max_unique, mallangder=targets),
+                               "prestanda.json", "application/json")
+            if 'profil' in plan:
+                st.subheader("cProfile")
+                st.code(plan['profil'])
+                st.download_button("📥 Ladda ner profilen (.prof)", plan['profil_data'], "kapmaskin.prof")
 
 # --- FLIK 2: PRISKALKYL (Helt återställd) ---
 with tab2:
@@ -177,25 +218,91 @@ with tab2:
         setup_cost = st.number_input("Ställkostnad (kr)", value=0.0)
         margin_pct = st.number_input("Önskad vinstmarginal (%)", value=60.0)
 
-    # Beräkningar
-    calc_prod_cost_m3 = st.session_state.shift_cost / capacity_m3_shift if capacity_m3_shift > 0 else 0
-    vol_m_raw = (raw_t * raw_b) / 1_000_000 
-    vol_m_nom = (nom_t * nom_b) / 1_000_000
-    
-    raw_cost_lpm = (vol_m_raw * raw_price_m3) / split_parts
-    prod_cost_lpm = vol_m_nom * (calc_prod_cost_m3 + plane_cost_m3)
-    
-    total_cost_lpm = raw_cost_lpm + prod_cost_lpm
-    final_sale_lpm = total_cost_lpm * (1 + (margin_pct/100))
-    total_order_price = (final_sale_lpm * order_m) + (setup_cost * (1 + (margin_pct/100)))
+    # Beräkningar (samma kalkyl som för orderboken nedan)
+    q = {k: float(v) for k, v in quote(order_m, raw_price_m3, raw_t, raw_b, nom_t, nom_b, split_parts, capacity_m3_shift,
+                                       plane_cost_m3, setup_cost, margin_pct, st.session_state.shift_cost).items()}
+    raw_cost_lpm, prod_cost_lpm, total_cost_lpm = q['raw_cost_lpm'], q['prod_cost_lpm'], q['total_cost_lpm']
+    final_sale_lpm, total_order_price = q['final_sale_lpm'], q['total_order_price']
 
     st.divider()
     res1, res2, res3 = st.columns(3)
     res1.metric("Försäljningspris / lpm", f"{final_sale_lpm:.2f} kr")
-    res2.metric("Pris / m³ (färdig vara)", f"{int(final_sale_lpm / vol_m_nom if vol_m_nom > 0 else 0)} kr")
+    res2.metric("Pris / m³ (färdig vara)", f"{int(q['sale_m3'])} kr")
     res3.metric("Totalvärde Order", f"{int(total_order_price)} kr")
     
     with st.expander("Se detaljerad kostnadskalkyl"):
         st.write(f"Råvarukostnad: {raw_cost_lpm:.2f} kr/lpm")
         st.write(f"Produktionskostnad: {prod_cost_lpm:.2f} kr/lpm")
         st.write(f"Självkostnadspris: {total_cost_lpm:.2f} kr/lpm")
+
+    # --- ORDERBOK: HELA PRISLISTOR PÅ EN GÅNG ---
+    st.divider()
+    st.subheader("📚 Orderbok")
+    st.caption("En rad per dimension och orderstorlek. Kolumner som saknas i filen, eller tomma celler, "
+               "tas från fälten ovan; skiftkostnaden från sidopanelen.")
+    st.download_button("📄 Mall för orderbok (CSV)", to_bytes(iter_csv([label for label, others in ORDER_COLUMNS.values()], []), bom=True),
+                       "orderbok_mall.csv", "text/csv")
+    order_file = st.file_uploader("Ladda upp orderbok (Excel/CSV)", type=["xlsx", "csv"], key="orderbok_fil")
+    if order_file:
+        # Senast lästa orderbok sparas i sessionen, så att ändrade fält inte läser om filen
+        key = file_digest(order_file)
+        if st.session_state.get('orderbok_key') != key:
+            try:
+                st.session_state.orderbok = read_order_book(order_file)
+            except ValueError as e:
+                st.session_state.orderbok = str(e)
+            st.session_state.orderbok_key = key
+        orders = st.session_state.orderbok
+        if isinstance(orders, str):
+            st.error(orders)
+        else:
+            defaults = {'raw_price_m3': raw_price_m3, 'split_parts': split_parts, 'capacity_m3_shift': capacity_m3_shift,
+                        'plane_cost_m3': plane_cost_m3, 'setup_cost': setup_cost, 'margin_pct': margin_pct}
+            calc_start = time.perf_counter()
+            quotes = quote_frame(orders, defaults, st.session_state.shift_cost).round(2)
+            calc_ms = (time.perf_counter() - calc_start) * 1000
+            order_value = quotes[QUOTE_COLUMNS['total_order_price']]
+
+            o1, o2, o3 = st.columns(3)
+            o1.metric("Orderrader", len(quotes))
+            o2.metric("Totalvärde orderbok", f"{int(order_value.sum())} kr")
+            o3.metric("Löpmeter totalt", f"{int(orders['order_m'].sum())} lpm")
+            invalid = int(orders[list(REQUIRED)].isna().any(axis=1).sum())
+            if invalid:
+                st.warning(f"{invalid} rader saknar orderstorlek eller dimension och har inget pris.")
+            st.caption(f"Beräknat på {calc_ms:.0f} ms")
+            st.dataframe(quotes, hide_index=True, use_container_width=True)
+
+            # Offerten som CSV byggs en gång per orderbok och kalkyl och sparas i sessionen; Excel-filen
+            # (några sekunder för stora orderböcker) först på begäran. download_button tar bara färdiga bytes
+            quote_key = (st.session_state.orderbok_key, tuple(sorted(defaults.items())), st.session_state.shift_cost)
+            offert = st.session_state.get('offert')
+            if offert is None or offert['key'] != quote_key:
+                offert = st.session_state.offert = {'key': quote_key, 'xlsx': None,
+                                                    'csv': to_bytes(iter_csv(quotes.columns, frame_rows(quotes)), bom=True)}
+            d1, d2 = st.columns(2)
+            d1.download_button("📥 Ladda ner offert (CSV)", offert['csv'], "offert.csv", "text/csv", use_container_width=True)
+            if offert['xlsx'] is not None:
+                d2.download_button("📥 Ladda ner offert (Excel)", offert['xlsx'], "offert.xlsx", use_container_width=True)
+            elif d2.button("📊 Skapa offert i Excel", use_container_width=True):
+                offert['xlsx'] = write_xlsx(quotes.columns, frame_rows(quotes), sheet="Offert")
+                st.rerun()
+
+            st.subheader("📈 Känslighet: marginal och skiftkostnad")
+            st.caption("Orderbokens totalvärde för varje kombination. Marginalen här ersätter orderbokens och fältets.")
+            g1, g2, g3, g4, g5, g6 = st.columns(6)
+            m_from = g1.number_input("Marginal från (%)", value=max(0.0, margin_pct - 30), step=5.0)
+            m_to = g2.number_input("Marginal till (%)", value=margin_pct + 30, step=5.0)
+            m_step = g3.number_input("Steg (%)", min_value=0.5, value=10.0, step=0.5)
+            s_from = g4.number_input("Skiftkostnad från (kr)", value=max(0.0, st.session_state.shift_cost - 5000), step=500.0)
+            s_to = g5.number_input("Skiftkostnad till (kr)", value=st.session_state.shift_cost + 5000, step=500.0)
+            s_step = g6.number_input("Steg (kr)", min_value=100.0, value=1000.0, step=100.0)
+            margins = np.arange(m_from, m_to + m_step / 2, m_step); shift_costs = np.arange(s_from, s_to + s_step / 2, s_step)
+            if len(margins) * len(shift_costs) > 10000:
+                st.warning("För många kombinationer; öka stegen.")
+            elif len(margins) and len(shift_costs):
+                grid = sensitivity_grid(orders, defaults, margins, shift_costs).round(0)
+                st.dataframe(grid.rename(columns=lambda m: f"{m:g} %", index=lambda c: f"{c:.0f} kr"), use_container_width=True)
+                grid_out = grid.rename(columns=lambda m: f"Marginal {m:g} %").reset_index()
+                st.download_button("📥 Ladda ner känslighetsanalysen (CSV)",
+                                   to_bytes(iter_csv(grid_out.columns, frame_rows(grid_out)), bom=True), "kanslighet.csv", "text/csv")